@@ -1,19 +1,35 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
+import logging
 import os
 import re
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Dict, Any, List, Tuple
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
+import ahocorasick
+import httpx
+import orjson
+from prometheus_client import Counter, Histogram, make_asgi_app
 
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import Runnable
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_openai import ChatOpenAI
-from langchain_community.chat_message_histories import MongoDBChatMessageHistory
+from pymongo import DESCENDING, MongoClient
+from pymongo.errors import OperationFailure, WriteError
+
+logger = logging.getLogger(__name__)
 
 # ───────────────────────────── env ─────────────────────────────
 load_dotenv()
@@ -23,6 +39,19 @@ DB_NAME = os.getenv("DB_NAME", "chat_service")
 SEA_LION_API_BASE = os.getenv("SEA_LION_API_BASE", "").rstrip("/")
 SEA_LION_API_KEY = os.getenv("SEA_LION_API_KEY", "")
 SEA_LION_MODEL = os.getenv("SEA_LION_MODEL", "sealion-chat")
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+# Only the most recent turns are replayed to the LLM; older history stays in Mongo
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "12"))
+
+# Intent micro-batching: coalesce concurrent LLM lookups within this window
+INTENT_BATCH_WINDOW_S = float(os.getenv("INTENT_BATCH_WINDOW_MS", "8")) / 1000.0
+INTENT_BATCH_MAX = int(os.getenv("INTENT_BATCH_MAX", "16"))
+
+# Optional cross-worker cache of validated intent labels (disabled when REDIS_URL is empty)
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+LLM_CACHE_TTL_S = int(os.getenv("LLM_CACHE_TTL_S", "86400"))
+# Short socket timeouts so a Redis outage degrades to a cache miss quickly
+REDIS_TIMEOUT_S = float(os.getenv("REDIS_TIMEOUT_S", "0.5"))
 
 if not MONGODB_URI:
     raise RuntimeError("MONGODB_URI is not set")
@@ -38,7 +67,7 @@ DEFAULT_SYSTEM_PROMPT = (
     "and mirror the user's latest message language. If information is missing, ask one concise question."
 )
 
-app = FastAPI(title="Sea Lion Chat API", version="1.5.0")
+app = FastAPI(title="Sea Lion Chat API", version="1.5.0", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,6 +77,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ────────────────────────── metrics ────────────────────────────
+INTENT_BATCH_SIZE = Histogram(
+    "intent_batch_size", "Queued intent lookups dispatched together per batch window",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+INTENT_COALESCED = Counter(
+    "intent_coalesced_total", "Intent lookups that shared an upstream call with an identical query",
+)
+
+def _metrics_app():
+    # Under several uvicorn workers each process keeps its own counters; with
+    # PROMETHEUS_MULTIPROC_DIR set, a scrape aggregates every worker's files.
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import CollectorRegistry, multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return make_asgi_app(registry=registry)
+    return make_asgi_app()
+
+app.mount("/metrics", _metrics_app())
+
 # ─────────────────────────── schemas ───────────────────────────
 class ChatRequest(BaseModel):
     thread_id: str
@@ -68,12 +119,22 @@ class SimpleChatResponse(BaseModel):
     reply: str
 
 # ───────────────────────────── LLMs ────────────────────────────
+# One pooled async client shared by both models so /chat calls multiplex on
+# the event loop instead of holding a worker thread each. HTTP/2 lets
+# concurrent calls share a single TLS connection to Sea-Lion.
+http_async_client = httpx.AsyncClient(
+    http2=True,
+    timeout=httpx.Timeout(LLM_TIMEOUT_S, connect=5.0),
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=60.0),
+)
+
 # Main conversational model (language-mirroring)
 chat_llm = ChatOpenAI(
     api_key=SEA_LION_API_KEY,
     base_url=SEA_LION_API_BASE,
     model=SEA_LION_MODEL,
     temperature=0.2,
+    http_async_client=http_async_client,
 )
 
 # Deterministic intent classifier (tiny budget; same provider)
@@ -83,25 +144,77 @@ intent_llm = ChatOpenAI(
     model=SEA_LION_MODEL,
     temperature=0.0,
     max_tokens=16,
+    http_async_client=http_async_client,
 )
 
 # ───────────────────── chat chain (with history) ───────────────
 chat_prompt = ChatPromptTemplate.from_messages(
     [
         ("system", DEFAULT_SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="history"),
+        MessagesPlaceholder(variable_name="history", n_messages=CHAT_HISTORY_MAX_MESSAGES),
         ("human", "{input}"),
     ]
 )
 core_chain: Runnable = chat_prompt | chat_llm
 
-def get_session_history(session_id: str) -> MongoDBChatMessageHistory:
-    return MongoDBChatMessageHistory(
-        connection_string=MONGODB_URI,
-        database_name=DB_NAME,
-        collection_name="chat_histories",
-        session_id=session_id,
-    )
+# One pymongo pool for the whole process (MongoClient is thread-safe); the
+# stock history class would open a fresh client per construction.
+HISTORY_COLLECTION = "chat_histories"
+_mongo_client = MongoClient(MONGODB_URI, maxPoolSize=100)
+_history_index_ready = False
+
+class PooledMongoDBChatMessageHistory(BaseChatMessageHistory):
+    """Chat history on the shared client and collection.
+
+    Documents keep langchain's MongoDBChatMessageHistory shape
+    ({"SessionId": ..., "History": <json message>}), so existing histories load
+    unchanged. Mongo errors are logged, not raised, as the stock class does.
+    """
+
+    def __init__(self, session_id: str):
+        global _history_index_ready
+        self.session_id = session_id
+        self.collection = _mongo_client[DB_NAME][HISTORY_COLLECTION]
+        if not _history_index_ready:
+            self.collection.create_index("SessionId")
+            _history_index_ready = True
+
+    @property
+    def messages(self) -> List[BaseMessage]:  # type: ignore[override]
+        """Load only the newest CHAT_HISTORY_MAX_MESSAGES, oldest first."""
+        try:
+            cursor = (
+                self.collection.find({"SessionId": self.session_id}, {"History": 1})
+                .sort("_id", DESCENDING)
+                .limit(CHAT_HISTORY_MAX_MESSAGES)
+            )
+            items = [json.loads(doc["History"]) for doc in cursor]
+        except OperationFailure:
+            logger.exception("chat history read failed")
+            return []
+        items.reverse()
+        return messages_from_dict(items)
+
+    def add_message(self, message: BaseMessage) -> None:
+        try:
+            self.collection.insert_one(
+                {"SessionId": self.session_id, "History": json.dumps(message_to_dict(message))}
+            )
+        except WriteError:
+            logger.exception("chat history write failed")
+
+    def clear(self) -> None:
+        try:
+            self.collection.delete_many({"SessionId": self.session_id})
+        except WriteError:
+            logger.exception("chat history clear failed")
+
+
+# Messages are still read from Mongo on every turn, so reusing the wrapper is
+# safe across uvicorn workers.
+@lru_cache(maxsize=10_000)
+def get_session_history(session_id: str) -> BaseChatMessageHistory:
+    return PooledMongoDBChatMessageHistory(session_id)
 
 chat_chain = RunnableWithMessageHistory(
     core_chain,
@@ -142,26 +255,212 @@ intent_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-def classify_intent_llm(text: str) -> str:
+# Keyword table for the fast path. Order of labels doubles as tie-break priority.
+_INTENT_KEYWORDS: Dict[str, tuple[str, ...]] = {
+    "view_appointments": (
+        "appointment", "appointments", "polyclinic", "clinic", "check up", "check-up",
+        "checkup", "consultation", "doctor visit", "see a doctor", "see doctor",
+    ),
+    "view_lab_results": (
+        "lab result", "lab results", "lab report", "lab reports", "blood test",
+        "test result", "test results", "pathology",
+    ),
+    "view_immunisations": (
+        "immunisation", "immunisations", "immunization", "immunizations",
+        "vaccination", "vaccinations", "vaccine", "vaccines", "vax", "jab", "jabs",
+        "booster", "boosters",
+    ),
+    "view_payments": (
+        "bill", "bills", "billing", "invoice", "invoices", "payment", "payments",
+    ),
+}
+_LABEL_PRIORITY = {label: i for i, label in enumerate(_INTENT_KEYWORDS)}
+
+# Built once at import; each hit carries (label, keyword length) so we can
+# recover the match start and enforce word boundaries.
+_intent_automaton = ahocorasick.Automaton()
+for _label, _words in _INTENT_KEYWORDS.items():
+    for _w in _words:
+        _intent_automaton.add_word(_w, (_label, len(_w)))
+_intent_automaton.make_automaton()
+
+def _is_word_edge(text: str, i: int) -> bool:
+    return i < 0 or i >= len(text) or not text[i].isalnum()
+
+@lru_cache(maxsize=1024)
+def classify_intent_keywords(text: str) -> str:
+    """Vote over keyword hits; returns 'none' when nothing matches."""
+    t = (text or "").lower()
+    votes: Dict[str, int] = {}
+    for end, (label, n) in _intent_automaton.iter(t):
+        start = end - n + 1
+        if _is_word_edge(t, start - 1) and _is_word_edge(t, end + 1):
+            votes[label] = votes.get(label, 0) + 1
+    if not votes:
+        return "none"
+    return max(votes, key=lambda lbl: (votes[lbl], -_LABEL_PRIORITY[lbl]))
+
+_INTENT_LABELS = frozenset(label_to_trigger) | {"none"}
+
+async def _classify_intent_single(q: str) -> Optional[str]:
+    """LLM label for `q`, or None when the reply isn't a known label."""
+    msgs = intent_prompt.format_messages(q=q)
+    out = (await intent_llm.ainvoke(msgs)).content.strip().lower()
+    return out if out in _INTENT_LABELS else None
+
+class IntentBatcher:
+    """
+    Coalesces concurrent LLM intent lookups.
+
+    Requests queue up for at most `window_s` (or until `max_batch` are waiting).
+    Identical queries then share one call, and distinct queries are classified
+    by separate single-item calls dispatched together over the shared HTTP/2
+    client, so one user's text never shares a completion with another's. An
+    upstream error is raised to its caller; an unusable reply resolves to None.
+    """
+
+    def __init__(self, window_s: float = INTENT_BATCH_WINDOW_S, max_batch: int = INTENT_BATCH_MAX):
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._dispatching: set = set()  # strong refs to in-flight dispatch tasks
+
+    async def classify(self, q: str) -> Optional[str]:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((q, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Don't hold the queue while this window's calls are in flight
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        uniq = list(dict.fromkeys(q for q, _ in batch))
+        INTENT_BATCH_SIZE.observe(len(batch))
+        if len(batch) > len(uniq):
+            INTENT_COALESCED.inc(len(batch) - len(uniq))
+
+        labels: Dict[str, Optional[str]] = {}
+        errors: Dict[str, BaseException] = {}
+        results = await asyncio.gather(
+            *(_classify_intent_single(q) for q in uniq), return_exceptions=True
+        )
+        for q, res in zip(uniq, results):
+            if isinstance(res, BaseException):
+                errors[q] = res
+            else:
+                labels[q] = res
+
+        for q, fut in batch:
+            if fut.done():
+                continue
+            if q in errors:
+                fut.set_exception(errors[q])
+            else:
+                fut.set_result(labels.get(q))
+
+intent_batcher = IntentBatcher()
+
+# Recent LLM labels by normalized query; repeated phrasings skip the batcher entirely
+_INTENT_LRU: OrderedDict[str, str] = OrderedDict()
+_INTENT_LRU_MAX = 1024
+
+# Optional Redis copy of the same labels so every worker shares them. Only
+# labels parsed from a successful reply are written; raw replies never are.
+_intent_redis = None
+if REDIS_URL:
+    from redis.asyncio import Redis
+
+    _intent_redis = Redis.from_url(
+        REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT_S, socket_timeout=REDIS_TIMEOUT_S
+    )
+
+def _intent_redis_key(q: str) -> str:
+    return "intent:" + hashlib.sha256(q.encode("utf-8")).hexdigest()
+
+async def _shared_intent_get(q: str) -> Optional[str]:
+    if _intent_redis is None:
+        return None
     try:
-        msgs = intent_prompt.format_messages(q=text)
-        out = intent_llm.invoke(msgs).content.strip().lower()
-        allowed = set(label_to_trigger.keys()) | {"none"}
-        return out if out in allowed else "none"
+        raw = await _intent_redis.get(_intent_redis_key(q))
     except Exception:
-        return "none"
+        logger.warning("intent cache read failed", exc_info=True)
+        return None
+    label = raw.decode("utf-8") if raw else None
+    return label if label in _INTENT_LABELS else None
+
+async def _shared_intent_put(q: str, label: str) -> None:
+    if _intent_redis is None:
+        return
+    try:
+        await _intent_redis.set(_intent_redis_key(q), label, ex=LLM_CACHE_TTL_S)
+    except Exception:
+        logger.warning("intent cache write failed", exc_info=True)
+
+def _remember_intent(q: str, label: str) -> None:
+    _INTENT_LRU[q] = label
+    if len(_INTENT_LRU) > _INTENT_LRU_MAX:
+        _INTENT_LRU.popitem(last=False)
+
+async def classify_intent_llm(text: str) -> str:
+    # Fast path: keyword automaton (no network hop)
+    label = classify_intent_keywords(text)
+    if label != "none":
+        return label
+    # Collapse case/whitespace so cache keys are stable
+    q = " ".join(text.lower().split())
+    if q in _INTENT_LRU:
+        _INTENT_LRU.move_to_end(q)
+        return _INTENT_LRU[q]
+    if (label := await _shared_intent_get(q)) is not None:
+        _remember_intent(q, label)
+        return label
+    try:
+        label = await intent_batcher.classify(q)
+    except Exception:
+        return "none"  # upstream failure: not cached, so the next turn retries
+    if label is None:
+        return "none"  # unusable reply: don't pin it either
+    _remember_intent(q, label)
+    await _shared_intent_put(q, label)
+    return label
 
 # ──────────────── light normalization for intent ───────────────
-_ABBREV = [
-    (re.compile(r"\b(appt|appts)\b", re.I), "appointments"),
-    (re.compile(r"\bvax\b", re.I), "vaccination"),
-    (re.compile(r"\bimms?\b", re.I), "immunisations"),
-]
+_ABBREV_RE = re.compile(r"\b(?:(?P<a>appts?)|(?P<v>vax)|(?P<i>imms?))\b", re.I)
+_ABBREV_MAP = {"a": "appointments", "v": "vaccination", "i": "immunisations"}
 def normalize_for_intent(s: str) -> str:
-    t = s or ""
-    for pat, rep in _ABBREV:
-        t = pat.sub(rep, t)
-    return t
+    return _ABBREV_RE.sub(lambda m: _ABBREV_MAP[m.lastgroup], s or "")
+
+# Cheap O(len) gate for ASCII turns: without any intent-domain word the turn is
+# generic chat, so neither the keyword matcher nor the LLM classifier needs to run.
+_INTENT_KEYWORD_RE = re.compile(
+    r"\b(appointments?|polyclinic|clinic|check[- ]?up|consultation|doctor|lab|blood|tests?|"
+    r"results?|reports?|pathology|vax|vaccin\w*|immuni[sz]\w*|jabs?|shots?|boosters?|"
+    r"bill\w*|invoices?|payments?|pay|"
+    # Malay/Indonesian turns are ASCII too, so they need their own terms
+    r"temujanji|temu|klinik|doktor|dokter|makmal|ujian|keputusan|hasil|laporan|darah|"
+    r"vaksin\w*|imunisasi|suntikan|bil|tagihan|bayar\w*|pembayaran)\b",
+    re.I,
+)
 
 # Regex fallback for appointment-like phrasing (e.g., polyclinic check up)
 APPT_FALLBACK = re.compile(
@@ -178,27 +477,39 @@ def health() -> dict:
 # If LLM (or fallback) detects a HealthHub-record intent, SHORT-CIRCUIT:
 #   reply with: type or say "<canonical trigger>"
 # Otherwise, return normal chat response.
-@app.post("/chat", response_model=SimpleChatResponse)
-def chat_simple(req: SimpleChatRequest) -> SimpleChatResponse:
-    try:
-        user_raw = req.prompt or ""
-        to_classify = normalize_for_intent(user_raw)
+async def intent_shortcut_reply(user_raw: str) -> Optional[str]:
+    """Return the exact trigger instruction for an agent/run intent, else None."""
+    to_classify = normalize_for_intent(user_raw)
 
-        label = classify_intent_llm(to_classify)
+    label = "none"
+    # The keyword gate is English-only; other scripts always go to the
+    # multilingual classifier
+    if not to_classify.isascii() or _INTENT_KEYWORD_RE.search(to_classify):
+        label = await classify_intent_llm(to_classify)
         if label == "none" and APPT_FALLBACK.search(user_raw):
             label = "view_appointments"
 
+    if label in label_to_trigger:
+        phrase = label_to_trigger[label]   # e.g. "view appointments"
+        return f'type or say "{phrase}"'
+    return None
+
+def _sse(payload: Dict[str, Any]) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+@app.post("/chat", response_model=SimpleChatResponse)
+async def chat_simple(req: SimpleChatRequest) -> SimpleChatResponse:
+    try:
+        user_raw = req.prompt or ""
+
         # Short-circuit path: force exact instruction that triggers agent/run
-        if label in label_to_trigger:
-            phrase = label_to_trigger[label]   # e.g. "view appointments"
-            return SimpleChatResponse(
-                thread_id=req.thread_id,
-                reply=f'type or say "{phrase}"'
-            )
+        shortcut = await intent_shortcut_reply(user_raw)
+        if shortcut is not None:
+            return SimpleChatResponse(thread_id=req.thread_id, reply=shortcut)
 
         # Normal chat path (language mirroring + history)
         cfg = {"configurable": {"session_id": req.thread_id}}
-        ai_msg = chat_chain.invoke({"input": user_raw}, cfg)
+        ai_msg = await chat_chain.ainvoke({"input": user_raw}, cfg)
         reply_text = getattr(ai_msg, "content", "") or ""
         if not reply_text:
             raise ValueError("Empty response from LLM")
@@ -207,3 +518,39 @@ def chat_simple(req: SimpleChatRequest) -> SimpleChatResponse:
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: SimpleChatRequest) -> StreamingResponse:
+    """
+    Same routing as /chat, streamed as server-sent events:
+      data: {"delta": "..."}  (repeated)
+      data: {"done": true, "thread_id": "..."}
+    Errors after the stream has started arrive as data: {"error": "..."}.
+    """
+    try:
+        user_raw = req.prompt or ""
+        shortcut = await intent_shortcut_reply(user_raw)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        if shortcut is not None:
+            yield _sse({"delta": shortcut})
+        else:
+            cfg = {"configurable": {"session_id": req.thread_id}}
+            try:
+                async for chunk in chat_chain.astream({"input": user_raw}, cfg):
+                    delta = getattr(chunk, "content", "") or ""
+                    if delta:
+                        yield _sse({"delta": delta})
+            except Exception as e:
+                yield _sse({"error": str(e)})
+                return
+        yield _sse({"done": True, "thread_id": req.thread_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
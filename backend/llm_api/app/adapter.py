@@ -1,6 +1,94 @@
 # app/adapter.py
-import json, uuid
-from langchain_core.messages import AIMessage
+import json
+import re
+import uuid
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+import orjson
+from langchain_core.messages import AIMessage, ToolMessage
+
+# Scripted calls from the planner/reader subgraphs. ToolNode pairs results by id
+# within one AIMessage only, so a fixed per-tool id is enough.
+def ai_tool_call(name: str, args: Optional[Dict[str, Any]] = None) -> AIMessage:
+    return AIMessage(content="", tool_calls=[{
+        "id": f"call_{name}", "type": "tool_call", "name": name, "args": args or {}
+    }])
+
+def ai_tool_calls(*calls: Tuple[str, Dict[str, Any]]) -> AIMessage:
+    # Independent calls share one AIMessage; ToolNode runs them concurrently
+    return AIMessage(content="", tool_calls=[
+        {"id": f"call_{name}", "type": "tool_call", "name": name, "args": args or {}}
+        for name, args in calls
+    ])
+
+# get_page_state hands back the bridge's cached encoding, so consecutive reader
+# polls of an unchanged page see the very same string: decode it only once.
+_last_decoded: Tuple[Any, Dict[str, Any]] = (None, {})
+
+def tool_payload(msg: ToolMessage) -> Dict[str, Any]:
+    """Decoded ToolMessage content, unwrapping {"data": ...}. Shared; don't mutate."""
+    global _last_decoded
+    content = msg.content or "{}"
+    seen, decoded = _last_decoded
+    if content is seen:
+        return decoded
+    try:
+        payload = orjson.loads(content)
+    except Exception:
+        payload = {}
+    decoded = payload.get("data", payload) or {}
+    _last_decoded = (content, decoded)
+    return decoded
+
+_WS = re.compile(r"\s+")
+
+@lru_cache(maxsize=8192)
+def norm_text(s: str) -> str:
+    """Trim and collapse whitespace. Memoised: the snapshot readers normalise
+    the same short UI labels on every poll, often several times per pass."""
+    t = (s or "").strip()
+    # Most labels have no runs/tabs/newlines: skip the regex unless a double
+    # space or non-printable (\t, \n, NBSP, ...) character could need collapsing
+    if "  " in t or not t.isprintable():
+        t = _WS.sub(" ", t)
+    return t
+
+@lru_cache(maxsize=8192)
+def norm_lower(s: str) -> str:
+    """norm_text(s).lower(), memoised too: reader windows overlap, so one line
+    is lowercased for every window that covers it."""
+    return norm_text(s).lower()
+
+def extract_json(s: str) -> Optional[str]:
+    """Return the first balanced {...} object in `s` (fences/prose around it are skipped).
+
+    Single forward scan that tracks string literals, so braces inside values
+    and nested objects are handled; returns None if no object closes.
+    """
+    i = s.find("{")
+    if i < 0:
+        return None
+    depth = 0
+    in_str = False
+    esc = False
+    for j in range(i, len(s)):
+        c = s[j]
+        if in_str:
+            if esc:
+                esc = False
+            elif c == "\\":
+                esc = True
+            elif c == '"':
+                in_str = False
+        elif c == '"':
+            in_str = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return s[i:j + 1]
+    return None
 
 def as_tool_call_ai_message(raw_text: str, allowed: set[str]) -> AIMessage:
     raw = raw_text.strip()
@@ -1,45 +1,16 @@
 # app/config.py
 import os
 
-# The agent never acts itself; it must emit ONE tool call as strict JSON.
-SYSTEM = (
-    "You are a web task agent. You cannot execute actions yourself.\n"
-    'Respond with EXACTLY ONE JSON object:\n'
-    '{"tool":"find|click|type|wait|done","args":{...}}\n'
-    "- Prefer robust selectors. If unsure, start with find(), then click()/type().\n"
-    "- Stop with tool done as soon as the goal is achieved.\n"
-    "- IMPORTANT: Output ONLY the JSON object — no extra text, no markdown."
-)
-
-# Keep this aligned with the tools the content script actually supports for planning.
-SCHEMA_HINT = (
-    "Valid tools and required args:\n"
-    '- find: {"query": "<text to search for>"}\n'
-    '- click: {"selector": "<robust CSS selector>"}\n'
-    '- type: {"selector": "<robust CSS selector>", "text": "<what to type>"}\n'
-    "- wait: {\"seconds\": <integer seconds>}\n"
-    '- done: {"reason": "<why we are done>"}\n'
-    "Return ONLY one JSON object with keys tool and args."
-)
-
-# Normalizer constrains free-form goals to one of the 4 rails
-NORMALIZER_SYSTEM = (
-    "You are an intent normaliser for a web automation agent.\n"
-    "The agent can only use: find(query), click(selector), type(selector,text), wait(seconds), done(reason).\n"
-    "Map any goal to EXACTLY ONE of these workflows: appointments | lab_results | payments | immunisations.\n"
-    "Given the user goal AND PAGE_VOCAB (UI words), output STRICT JSON ONLY:\n"
-    '{"intent":"<short verb>",'
-    '"target":"<main noun/entity>",'
-    '"query":"<best keyword(s) for find()>",'
-    '"canonical_goal":"<step-by-step plan using find/click/type/wait/done>"}\n'
-    "Guidelines:\n"
-    "- Prefer query terms that appear in PAGE_VOCAB.\n"
-    "- Include type() if a search box is needed.\n"
-    "- Keep the plan short and deterministic; start with find() and end with done().\n"
-    "- If unclear, pick a safe generic keyword from PAGE_VOCAB (appointments, lab results, payments, immunisation records)."
-)
-
 # Model/config (leave as env-driven; keep sensible default)
 SEA_LION_BASE_URL = os.getenv("SEA_LION_BASE_URL")
 SEA_LION_API_KEY  = os.getenv("SEA_LION_API_KEY")
 SEA_LION_MODEL    = os.getenv("SEA_LION_MODEL", "aisingapore/Gemma-SEA-LION-v3-9B-IT")
+LLM_TIMEOUT_S     = float(os.getenv("LLM_TIMEOUT_S", "60"))
+
+# Optional Redis cache of validated route/selector picks, shared across workers
+REDIS_URL         = os.getenv("REDIS_URL", "").strip()
+LLM_CACHE_TTL_S   = int(os.getenv("LLM_CACHE_TTL_S", "86400"))
+REDIS_TIMEOUT_S   = float(os.getenv("REDIS_TIMEOUT_S", "0.5"))  # outage → quick cache miss
+# Opt-in local SQLite cache of raw replies, e.g. ".lc_cache.sqlite". It has no
+# TTL or size cap and keeps raw replies (bad ones too) across restarts.
+LLM_CACHE_PATH    = os.getenv("LLM_CACHE_PATH", "").strip()
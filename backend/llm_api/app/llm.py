@@ -1,10 +1,85 @@
+import logging
+from functools import lru_cache
+from typing import Any, Optional
+
+import httpx
+import orjson
+import xxhash
 from langchain_openai import ChatOpenAI
-from .config import SEA_LION_API_KEY, SEA_LION_BASE_URL, SEA_LION_MODEL
+from .config import (
+    SEA_LION_API_KEY, SEA_LION_BASE_URL, SEA_LION_MODEL, LLM_TIMEOUT_S, REDIS_URL, LLM_CACHE_TTL_S,
+    LLM_CACHE_PATH, REDIS_TIMEOUT_S,
+)
+
+# One keep-alive HTTP/2 pool for every make_llm() instance; the router and
+# selector calls in a single plan then reuse the same TLS connection.
+_HTTP_TIMEOUT = httpx.Timeout(LLM_TIMEOUT_S, connect=5.0)
+_HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=60.0)
+_http_client = httpx.Client(http2=True, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS)
+# The graphs call ainvoke(); without this ChatOpenAI builds its own async
+# client, so give the async path the same warm pool settings.
+_http_async_client = httpx.AsyncClient(http2=True, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS)
+
+
+log = logging.getLogger(__name__)
+
+# Optional Redis copy of the validated router/selector picks, shared by every
+# worker. Callers store parsed results only, never raw LLM replies, so a bad
+# reply is retried on the next request instead of being replayed for a day.
+_redis = None
+if REDIS_URL:
+    from redis.asyncio import Redis
+    _redis = Redis.from_url(
+        REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT_S, socket_timeout=REDIS_TIMEOUT_S
+    )
+
+def _shared_key(kind: str, parts: Any) -> str:
+    return f"{kind}:{xxhash.xxh3_128_hexdigest(orjson.dumps(parts))}"
+
+async def shared_cache_get(kind: str, parts: Any) -> Optional[str]:
+    """Cached value for (kind, parts), or None when missing/unavailable."""
+    if _redis is None:
+        return None
+    try:
+        raw = await _redis.get(_shared_key(kind, parts))
+    except Exception:
+        log.warning("[llm] shared cache read failed", exc_info=True)
+        return None
+    return raw.decode("utf-8") if raw else None
+
+async def shared_cache_put(kind: str, parts: Any, value: str) -> None:
+    if _redis is None:
+        return
+    try:
+        await _redis.set(_shared_key(kind, parts), value, ex=LLM_CACHE_TTL_S)
+    except Exception:
+        log.warning("[llm] shared cache write failed", exc_info=True)
+
+async def aclose_http_clients() -> None:
+    """Close the shared pools; called on app shutdown."""
+    await _http_async_client.aclose()
+    _http_client.close()
+    if _redis is not None:
+        await _redis.aclose()
+
+# Opt-in raw reply cache for deterministic calls; None leaves it off.
+# Keys are the full prompt + model params, so prompt edits never hit stale entries.
+_llm_cache = None
+if LLM_CACHE_PATH:
+    # Opt-in single-host cache; persists across restarts but has no TTL
+    from langchain_community.cache import SQLiteCache
+    _llm_cache = SQLiteCache(database_path=LLM_CACHE_PATH)
 
+@lru_cache(maxsize=8)
 def make_llm(temperature: float = 0) -> ChatOpenAI:
+    """One shared client per temperature; ChatOpenAI holds no per-call state."""
     return ChatOpenAI(
         base_url=SEA_LION_BASE_URL,
         api_key=SEA_LION_API_KEY,
         model=SEA_LION_MODEL,
         temperature=temperature,
+        http_client=_http_client,
+        http_async_client=_http_async_client,
+        # Only cache deterministic calls; sampled replies should vary.
+        cache=_llm_cache if temperature == 0 else None,
     )
\ No newline at end of file
@@ -2,15 +2,17 @@
 import os
 from dotenv import load_dotenv
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.tools import set_latest_snapshot
 
 from .schemas import AgentRunRequest, AgentPlanResponse
 from .runner import run_plan_once
+from .llm import aclose_http_clients
 
 load_dotenv()
 
-app = FastAPI(title="Agentic HealthHub API", version="1.0.0")
+app = FastAPI(title="Agentic HealthHub API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # CORS — restrict in prod
 app.add_middleware(
@@ -21,21 +23,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("shutdown")
+async def _close_http_clients():
+    # Drain the shared LLM connection pools
+    await aclose_http_clients()
+
 @app.get("/health")
 async def health():
     return {"ok": True}
 
 @app.post("/agent/run", response_model=AgentPlanResponse)
-async def agent_run(req: AgentRunRequest) -> AgentPlanResponse:
+async def agent_run(req: AgentRunRequest) -> ORJSONResponse:
     """
     Stateless, single-shot planning endpoint.
     Returns:
       { "steps": [ { "tool": str, "args": dict }, ... ],
         "hint":  { "summary"?: str } }
     """
-    plan = run_plan_once(goal=req.goal, page_state=req.page_state)
-    # plan already matches AgentPlanResponse schema
-    return AgentPlanResponse(**plan)
+    plan = await run_plan_once(goal=req.goal, page_state=req.page_state)
+    # run_plan_once only emits normalised steps (see planner._normalize_args), so
+    # encode straight to JSON; response_model still documents the shape in OpenAPI
+    return ORJSONResponse(plan)
 
 @app.post("/bridge/snapshot")
 async def bridge_snapshot(payload: dict):
@@ -0,0 +1,27 @@
+# app/prompts.py
+# Every static LLM instruction lives here, frozen as module-level SystemMessages.
+# They are always placed FIRST in the message list (dynamic goal/page content
+# goes after), so an upstream server with prefix caching can reuse the same
+# prompt prefix for every call of a given kind.
+from langchain_core.messages import SystemMessage
+
+# Supervisor router: goal → one of four workflow tokens
+DECISION_INSTRUCTIONS = (
+    "You are a router. Reply with ONLY one token: lab_results | appointments | payments | immunisations.\n"
+    "  • lab results, lab reports, blood tests, pathology → lab_results\n"
+    "  • booking, rescheduling, appointment slots → appointments\n"
+    "  • bills, invoices, fees, making a payment → payments\n"
+    "  • vaccines, immunisations, boosters, jabs, shots → immunisations\n"
+    "If ambiguous, pick the most likely."
+)
+
+# Nav planners: pick one selector. Each planner fills in its own target and
+# example selector; nav_planner appends the per-workflow hint.
+SELECTOR_INSTRUCTIONS = (
+    "You are a precise web agent. Choose exactly ONE clickable CSS selector from the candidates "
+    "that {target}, following the hint below.\n"
+    "Return ONLY JSON, no prose. Example: {{\"selector\": \"{example}\"}}\n"
+    "If none are relevant, return {{}}."
+)
+
+DECISION_SYS_MSG = SystemMessage(content=DECISION_INSTRUCTIONS)
@@ -1,10 +1,10 @@
 # app/runner.py
-import json
+import asyncio
+import orjson
 from typing import Any, Dict, List
 
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage
-from .config import SYSTEM
-from .supervisor import build_supervisor_app
+from langchain_core.messages import AnyMessage, HumanMessage
+from .supervisor import build_supervisor_app, prefetch_route
 from .planner import messages_to_plan, done_reason
 
 SAFE_RECURSION_LIMIT = 30
@@ -16,7 +16,7 @@ def _coerce_page(page_state: str | Dict[str, Any] | None) -> Dict[str, Any]:
         return {}
     if isinstance(page_state, str):
         try:
-            return json.loads(page_state) or {}
+            return orjson.loads(page_state) or {}
         except Exception:
             return {}
     if isinstance(page_state, dict):
@@ -24,28 +24,33 @@ def _coerce_page(page_state: str | Dict[str, Any] | None) -> Dict[str, Any]:
     return {}
 
 
-def run_plan_once(goal: str, page_state: str | dict) -> dict:
+async def run_plan_once(goal: str, page_state: str | dict) -> dict:
     """
-    Single-shot: build a plan from SYSTEM / GOAL / PAGE_STATE and return:
+    Single-shot: build a plan from GOAL / PAGE_STATE and return:
       { "steps": [ {tool, args}, ... ], "hint": { "summary"?: str } }
 
     No threads, no resumption, no human-in-the-loop.
     """
     page = _coerce_page(page_state)
-    app = build_supervisor_app(page)
-
     goal_text = (goal or "").strip() or "Find the Book Appointment button"
     page_url = (page.get("url") or "")
     page_title = (page.get("title") or "")
 
+    # The route depends only on goal + url: start that LLM call first and
+    # compile the app off-loop meanwhile; decide() picks up the in-flight call.
+    prefetch_route(goal_text, page_url)
+    app = await asyncio.to_thread(build_supervisor_app, page)
+
+    page_ctx = {"url": page_url, "title": page_title}
     msgs: List[AnyMessage] = [
-        SystemMessage(SYSTEM),  # LLM must emit ONE valid tool call at a time (find/click/type/wait/done)
         HumanMessage(f"GOAL: {goal_text}"),
-        HumanMessage(f"PAGE_STATE: {json.dumps({'url': page_url, 'title': page_title})}"),
+        HumanMessage(f"PAGE_STATE: {orjson.dumps(page_ctx).decode()}"),
     ]
+    # Seed goal/page directly so the supervisor doesn't regex + re-parse them out of the messages
+    init = {"messages": msgs, "goal": goal_text, "page": page_ctx}
 
     try:
-        final_state = app.invoke({"messages": msgs}, config={"recursion_limit": SAFE_RECURSION_LIMIT})
+        final_state = await app.ainvoke(init, config={"recursion_limit": SAFE_RECURSION_LIMIT})
         steps = messages_to_plan(final_state.get("messages", []))
         summary = done_reason(final_state.get("messages", []))
         return {"steps": steps or [], "hint": ({"summary": summary} if summary else {})}
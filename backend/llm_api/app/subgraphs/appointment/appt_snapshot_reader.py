@@ -10,7 +10,9 @@ from typing import Annotated, Dict, Any, List, Optional, TypedDict, Tuple
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
 from langgraph.graph.message import add_messages
-from langchain_core.messages import AnyMessage, AIMessage, ToolMessage
+from langchain_core.messages import AnyMessage, ToolMessage
+
+from app.adapter import ai_tool_call as _ai_tool_call, norm_lower as _lower, norm_text as _norm, tool_payload
 
 log = logging.getLogger(__name__)
 log.propagate = True
@@ -28,8 +30,8 @@ APPT_URL_TOKEN = os.getenv("APPT_SNAPSHOT_URL_TOKEN", "/appointments")
 
 # Gate until URL shows the token
 APPT_GATE_MAX_TRIES   = int(os.getenv("APPT_GATE_MAX_TRIES", "12"))   # total polls for URL token
-APPT_GATE_POLL_MS     = int(os.getenv("APPT_GATE_POLL_MS", "250"))    # interval between polls
-APPT_GATE_INITIAL_MS  = int(os.getenv("APPT_GATE_INITIAL_MS", "300")) # one-time grace before first poll
+APPT_GATE_POLL_MS     = int(os.getenv("APPT_GATE_POLL_MS", "250"))    # max interval between polls
+APPT_GATE_POLL_MIN_MS = int(os.getenv("APPT_GATE_POLL_MIN_MS", "100")) # first poll interval; doubles per try
 
 # After URL token is seen, optionally do a few extra settle polls
 APPT_SETTLE_TRIES     = int(os.getenv("APPT_SETTLE_TRIES", "2"))
@@ -38,47 +40,39 @@ IDLE_HINT = {
     "timeout": int(os.getenv("APPT_IDLE_TIMEOUT_MS", "8000")),
 }
 
+# get_page_state args for retries: the pause runs inside the tool, right
+# before the snapshot is read, instead of as separate wait/wait_for_idle calls
+_SETTLE_SNAP = {"settle_ms": min(IDLE_HINT["quietMs"], IDLE_HINT["timeout"])}
+
+def _poll_snap(tries: int) -> Dict[str, int]:
+    """Adaptive backoff: short first poll, doubling up to APPT_GATE_POLL_MS."""
+    return {"settle_ms": min(APPT_GATE_POLL_MS, APPT_GATE_POLL_MIN_MS << max(tries - 1, 0))}
+
 # Optional structure checks (can be zeroed via env)
 MIN_TEXTS    = int(os.getenv("APPT_MIN_TEXTS", "20"))
 MIN_MATCHED  = int(os.getenv("APPT_MIN_MATCHED", "1"))
 
-# ───────────────────────── tool-call shims ─────────────────────────
-def _ai_tool_call(name: str, args: dict) -> AIMessage:
-    return AIMessage(content="", tool_calls=[{
-        "id": f"call_{name}", "type": "tool_call", "name": name, "args": args or {}
-    }])
-
-def _last_payload(msg: ToolMessage) -> Dict[str, Any]:
-    try:
-        payload = json.loads(msg.content or "{}")
-    except Exception:
-        payload = {}
-    return payload.get("data", payload) or {}
-
 # ───────────────────────── readiness checks ─────────────────────────
+# URL gate tokens, lowercased once (env overrides may be mixed-case)
+_HOST_LC = TARGET_HOST.lower()
+_TOKEN_LC = APPT_URL_TOKEN.lower()
+
 def _is_appt_url(url: Optional[str]) -> bool:
-    if not isinstance(url, str):
-        return False
-    u = url.lower()
-    return (TARGET_HOST in u) and (APPT_URL_TOKEN.lower() in u)
+    return type(url) is str and _HOST_LC in (u := url.lower()) and _TOKEN_LC in u
 
 # ───────────────────────── parsing helpers ─────────────────────────
-_WS = re.compile(r"\s+")
 _MONTHS = {
     "jan","feb","mar","apr","may","jun","jul","aug","sep","sept","oct","nov","dec",
     "january","february","march","april","june","july","august","september","october","november","december"
 }
+# Any month name contains one of the short forms, so one alternation covers
+# the substring test that used to loop over every entry of _MONTHS
+_MONTH_SUB_RX = re.compile("|".join(sorted(_MONTHS, key=len)))
 _DOW = {"mon","tue","tues","wed","thu","thur","thurs","fri","sat","sun","monday","tuesday","wednesday","thursday","friday","saturday","sunday"}
 _TIME_RX = re.compile(r"\b([01]?\d|2[0-3]):[0-5]\d\s*(AM|PM)?\b", re.I)
 _DAY_RX  = re.compile(r"^\s*(\d{1,2})\s*$")
 _YEAR_RX = re.compile(r"^\s*(20\d{2})\s*$")
 
-def _norm(s: str) -> str:
-    return _WS.sub(" ", (s or "").strip())
-
-def _lower(s: str) -> str:
-    return _norm(s).lower()
-
 def _looks_card_header(lines: List[str], i: int) -> Optional[Dict[str,str]]:
     """
     Heuristic for the card you showed:
@@ -95,11 +89,12 @@ def _looks_card_header(lines: List[str], i: int) -> Optional[Dict[str,str]]:
     if i + 2 >= N:
         return None
 
+    # Cheapest test first: this runs for every line and most aren't a day number
     day_ok = _DAY_RX.match(lines[i] or "")
-    mon_ok = _lower(lines[i+1]) in _MONTHS
-    yr_ok  = _YEAR_RX.match(lines[i+2] or "")
-
-    if not (day_ok and mon_ok and yr_ok):
+    if not day_ok:
+        return None
+    yr_ok = _YEAR_RX.match(lines[i+2] or "")
+    if not (yr_ok and _lower(lines[i+1]) in _MONTHS):
         return None
 
     info = {
@@ -115,7 +110,7 @@ def _looks_card_header(lines: List[str], i: int) -> Optional[Dict[str,str]]:
     j = i + 3
     end = min(N, i + 12)
     while j < end:
-        t = _norm(lines[j]); tl = _lower(t)
+        t = _norm(lines[j]); tl = t.lower()
         if not info["clinic"] and t and len(t) > 2:
             # often ends with 'Polyclinic' or has proper nouns
             info["clinic"] = t
@@ -125,17 +120,11 @@ def _looks_card_header(lines: List[str], i: int) -> Optional[Dict[str,str]]:
         # time often 'Wed, 09:10 AM' or '09:10 AM'
         if not info["time"]:
             m = _TIME_RX.search(t)
+            # search() also finds the time in "Wed, 09:10 AM"
             if m:
                 info["time"] = m.group(0).upper()
                 j += 1
                 continue
-            # tolerate "Wed, 09:10 AM" — if contains comma and a time, strip DOW
-            if "," in t:
-                m2 = _TIME_RX.search(t)
-                if m2:
-                    info["time"] = m2.group(0).upper()
-                    j += 1
-                    continue
 
         # procedure: a descriptive title (avoid room codes)
         if not info["procedure"] and t and not t.isupper() and len(t) >= 6 and "room" not in tl:
@@ -175,12 +164,13 @@ def _extract_appts_from_page_state(state: Dict[str, Any]) -> List[Dict[str, str]
 
     items: List[Dict[str,str]] = []
     N = len(lines)
+    # provider comes from page-level images (logos are often out of the text stream), so look it up once
+    prov = _extract_provider_from_images(state)
     i = 0
     while i < N:
         card = _looks_card_header(lines, i)
         if card:
-            # attach provider if available globally (logos are often out of the text stream)
-            prov = _extract_provider_from_images(state)
+            # attach provider if available globally
             if prov:
                 card["provider"] = prov
             items.append(card)
@@ -192,16 +182,16 @@ def _extract_appts_from_page_state(state: Dict[str, Any]) -> List[Dict[str, str]
     # If nothing matched, try a looser pass: detect any line that has both a date-ish month and a time
     if not items:
         for k in range(N-1):
-            t = lines[k]; tl = _lower(t)
-            if any(m in tl for m in _MONTHS) and _TIME_RX.search(" ".join(lines[k:k+3]) ):
+            t = lines[k]  # already normalised above
+            if _MONTH_SUB_RX.search(t.lower()) and (tm := _TIME_RX.search(" ".join(lines[k:k+3]))):
                 # best-effort fallback
                 item = {
                     "date": t,
-                    "time": _TIME_RX.search(" ".join(lines[k:k+3])).group(0).upper() if _TIME_RX.search(" ".join(lines[k:k+3])) else "",
+                    "time": tm.group(0).upper(),
                     "clinic": "",
                     "procedure": "",
                     "location": "",
-                    "provider": _extract_provider_from_images(state) or "",
+                    "provider": prov or "",
                 }
                 # guess clinic/procedure near by
                 if k+1 < N and not item["clinic"]:
@@ -211,13 +201,10 @@ def _extract_appts_from_page_state(state: Dict[str, Any]) -> List[Dict[str, str]
                 items.append(item)
 
     # dedupe
-    seen: set[Tuple[str,str,str,str,str]] = set()
-    uniq: List[Dict[str,str]] = []
+    uniq: Dict[Tuple[str,str,str,str,str], Dict[str,str]] = {}
     for it in items:
-        key = (it.get("date",""), it.get("time",""), it.get("clinic",""), it.get("procedure",""), it.get("location",""))
-        if key not in seen:
-            seen.add(key); uniq.append(it)
-    return uniq
+        uniq.setdefault((it.get("date",""), it.get("time",""), it.get("clinic",""), it.get("procedure",""), it.get("location","")), it)
+    return list(uniq.values())
 
 def _looks_structured(snap: Dict[str, Any]) -> bool:
     # very light structure check; ensure we have enough text lines and at least some month/time hints
@@ -225,7 +212,7 @@ def _looks_structured(snap: Dict[str, Any]) -> bool:
     if len(texts) < MIN_TEXTS:
         return False
     joined = " ".join([str(t.get("text","")) for t in texts if isinstance(t, dict)]).lower()
-    months_present = any(m in joined for m in _MONTHS)
+    months_present = bool(_MONTH_SUB_RX.search(joined))
     time_present = bool(_TIME_RX.search(joined))
     return months_present and time_present
 
@@ -273,7 +260,6 @@ class ApptReadState(TypedDict):
     messages: Annotated[List[AnyMessage], add_messages]
     prep_tries: int
     settle_tries: int
-    initial_wait_done: bool
 
 def build_appointments_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optional[List] = None):
     if tools is None:
@@ -281,55 +267,41 @@ def build_appointments_snapshot_reader_subgraph(page: Dict[str, Any], tools: Opt
         tools = build_tools(page)
 
     def node(state: ApptReadState) -> ApptReadState:
-        state.setdefault("prep_tries", 0)
-        state.setdefault("settle_tries", 0)
-        state.setdefault("initial_wait_done", False)
+        # Counters are read into locals; updates are returned, never written into state
+        prep_tries = state.get("prep_tries", 0)
+        settle_tries = state.get("settle_tries", 0)
 
         # If we don't have a get_page_state payload yet, request one.
         if not (state.get("messages") and isinstance(state["messages"][-1], ToolMessage)
                 and getattr(state["messages"][-1], "name", "") == "get_page_state"):
-            # First time in → an initial grace before first poll (once)
-            if not state["initial_wait_done"] and APPT_GATE_INITIAL_MS > 0:
-                state["initial_wait_done"] = True
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", {"quietMs": min(APPT_GATE_INITIAL_MS, 1000), "timeout": APPT_GATE_INITIAL_MS + 2000}),
-                    _ai_tool_call("wait", {"ms": APPT_GATE_INITIAL_MS}),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
-            # Otherwise, just get a snapshot
-            return {**state, "messages": [_ai_tool_call("get_page_state", {})]}
+            # Read right away: the extension posts a fresh snapshot just
+            # before /agent/run, so the first read needs no grace period
+            return {"messages": [_ai_tool_call("get_page_state", {})]}
 
         # We have a snapshot – decide whether to gate or extract.
         last = state["messages"][-1]
-        snap = _last_payload(last) or {}
+        snap = tool_payload(last) or {}
         url = (snap or {}).get("url", "")
         texts = snap.get("texts") or []
 
         # Stage 1: URL token gate (only proceed once the Appointments URL is visible)
         if not _is_appt_url(url):
-            tries = state["prep_tries"] + 1
-            state["prep_tries"] = tries
+            tries = prep_tries + 1
+            prep_tries = tries
             log.info("[appt_read] waiting for appointments URL (url=%s) try=%d/%d", url, tries, APPT_GATE_MAX_TRIES)
             if tries <= APPT_GATE_MAX_TRIES:
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", {"quietMs": 200, "timeout": 2000}),
-                    _ai_tool_call("wait", {"ms": APPT_GATE_POLL_MS}),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
+                return {"prep_tries": tries, "messages": [_ai_tool_call("get_page_state", _poll_snap(tries))]}
             # Timeout: proceed anyway with whatever we have
             log.info("[appt_read] appointments URL gate timed out; continuing with current snapshot")
 
         # Stage 2 (optional): give the DOM a moment to settle after URL switch
         if APPT_SETTLE_TRIES > 0 and not _looks_structured(snap):
-            settles = state["settle_tries"] + 1
-            state["settle_tries"] = settles
+            settles = settle_tries + 1
+            settle_tries = settles
             log.info("[appt_read] settling DOM (url=%s, texts=%d) settle=%d/%d",
                      url, len(texts), settles, APPT_SETTLE_TRIES)
             if settles <= APPT_SETTLE_TRIES:
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", IDLE_HINT),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
+                return {"settle_tries": settles, "messages": [_ai_tool_call("get_page_state", _SETTLE_SNAP)]}
 
         # Extract & finish
         items = _extract_appts_from_page_state(snap)
@@ -341,9 +313,9 @@ def build_appointments_snapshot_reader_subgraph(page: Dict[str, Any], tools: Opt
             "tts": _tts_list(items),     # NEW: speech-friendly
             "items": items,
             "reason": f"Extracted {len(items)} appointment(s)",
-            "gated": (state.get("prep_tries", 0) > 0) or (state.get("settle_tries", 0) > 0),
-            "prep_tries": state.get("prep_tries", 0),
-            "settle_tries": state.get("settle_tries", 0),
+            "gated": (prep_tries > 0) or (settle_tries > 0),
+            "prep_tries": prep_tries,
+            "settle_tries": settle_tries,
         }
         pretty = (json.dumps(payload, ensure_ascii=False)[:MAX_LOG_CHARS]
                   if isinstance(payload, dict) else str(payload))
@@ -352,7 +324,7 @@ def build_appointments_snapshot_reader_subgraph(page: Dict[str, Any], tools: Opt
             print("[appt_read] extracted:", pretty)
         except Exception:
             pass
-        return {**state, "messages": [_ai_tool_call("done", payload)]}
+        return {"messages": [_ai_tool_call("done", payload)]}
 
     g = StateGraph(ApptReadState)
     g.add_node("appt_read", node)
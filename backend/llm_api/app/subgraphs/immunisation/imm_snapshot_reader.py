@@ -10,7 +10,9 @@ from typing import Annotated, Dict, Any, List, Optional, TypedDict, Tuple
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
 from langgraph.graph.message import add_messages
-from langchain_core.messages import AnyMessage, AIMessage, ToolMessage
+from langchain_core.messages import AnyMessage, ToolMessage
+
+from app.adapter import ai_tool_call as _ai_tool_call, norm_lower as _lower, norm_text as _norm, tool_payload
 
 log = logging.getLogger(__name__)
 log.propagate = True
@@ -29,7 +31,7 @@ IMM_URL_TOKEN = os.getenv("IMM_SNAPSHOT_URL_TOKEN", "/immunisation")
 # Gate until URL shows the token
 IMM_GATE_MAX_TRIES   = int(os.getenv("IMM_GATE_MAX_TRIES", "12"))
 IMM_GATE_POLL_MS     = int(os.getenv("IMM_GATE_POLL_MS", "250"))
-IMM_GATE_INITIAL_MS  = int(os.getenv("IMM_GATE_INITIAL_MS", "300"))
+IMM_GATE_POLL_MIN_MS = int(os.getenv("IMM_GATE_POLL_MIN_MS", "100"))
 
 # After URL token is seen, optionally do a few extra settle polls
 IMM_SETTLE_TRIES     = int(os.getenv("IMM_SETTLE_TRIES", "2"))
@@ -38,32 +40,27 @@ IDLE_HINT = {
     "timeout": int(os.getenv("IMM_IDLE_TIMEOUT_MS", "8000")),
 }
 
+# get_page_state args for retries: the pause runs inside the tool, right
+# before the snapshot is read, instead of as separate wait/wait_for_idle calls
+_SETTLE_SNAP = {"settle_ms": min(IDLE_HINT["quietMs"], IDLE_HINT["timeout"])}
+
+def _poll_snap(tries: int) -> Dict[str, int]:
+    """Adaptive backoff: short first poll, doubling up to IMM_GATE_POLL_MS."""
+    return {"settle_ms": min(IMM_GATE_POLL_MS, IMM_GATE_POLL_MIN_MS << max(tries - 1, 0))}
+
 # Optional structure checks (can be zeroed via env)
 MIN_TEXTS     = int(os.getenv("IMM_MIN_TEXTS", "15"))
 REQUIRE_MONTH = os.getenv("IMM_REQUIRE_MONTH", "1").strip() not in {"0","false","False"}
 
-# ───────────────────────── tool-call shims ─────────────────────────
-def _ai_tool_call(name: str, args: dict) -> AIMessage:
-    return AIMessage(content="", tool_calls=[{
-        "id": f"call_{name}", "type": "tool_call", "name": name, "args": args or {}
-    }])
-
-def _last_payload(msg: ToolMessage) -> Dict[str, Any]:
-    try:
-        payload = json.loads(msg.content or "{}")
-    except Exception:
-        payload = {}
-    return payload.get("data", payload) or {}
-
 # ───────────────────────── readiness checks ─────────────────────────
+# URL gate tokens, lowercased once (env overrides may be mixed-case)
+_HOST_LC = TARGET_HOST.lower()
+_TOKEN_LC = IMM_URL_TOKEN.lower()
+
 def _is_imm_url(url: Optional[str]) -> bool:
-    if not isinstance(url, str):
-        return False
-    u = url.lower()
-    return (TARGET_HOST in u) and (IMM_URL_TOKEN.lower() in u)
+    return type(url) is str and _HOST_LC in (u := url.lower()) and _TOKEN_LC in u
 
 # ───────────────────────── parsing helpers ─────────────────────────
-_WS = re.compile(r"\s+")
 _MONTHS = {
     "jan","feb","mar","apr","may","jun","jul","aug","sep","sept","oct","nov","dec",
     "january","february","march","april","june","july","august","september","october","november","december"
@@ -84,11 +81,18 @@ _VACCINE_HINTS = (
     "var", "mmrv", "rotavirus", "zoster", "shingles", "td", "dt"
 )
 
-def _norm(s: str) -> str:
-    return _WS.sub(" ", (s or "").strip())
+def _minimal_hints(*groups) -> Tuple[str, ...]:
+    """Distinct hints minus any containing a shorter one ("january" ⊃ "jan"):
+    the same answer for `any(h in s ...)`, with fewer substring tests."""
+    hints = tuple(dict.fromkeys(h for g in groups for h in g))
+    return tuple(h for h in hints if not any(o != h and o in h for o in hints))
 
-def _lower(s: str) -> str:
-    return _norm(s).lower()
+# Precomputed once; the checks below run on every line of every poll.
+# Months are only looked for in the whole joined page text: on a string that
+# long one compiled alternation beats a dozen separate `in` scans by ~20x.
+_MONTH_RX = re.compile("|".join(_minimal_hints(sorted(_MONTHS))))
+_VACCINE_KEYS = _minimal_hints(_VACCINE_HINTS)
+_SIGNAL_KEYS = _minimal_hints(_VACCINE_HINTS, _DOSE_HINTS, _STATUS_HINTS, _FACILITY_HINTS, _BATCH_HINTS)
 
 def _find_first_date(text: str) -> Optional[str]:
     for rx in _DATE_RXES:
@@ -104,17 +108,10 @@ def _looks_structured(snap: Dict[str, Any]) -> bool:
     if not REQUIRE_MONTH:
         return True
     joined = " ".join([str(t.get("text","")) for t in texts if isinstance(t, dict)]).lower()
-    return any(m in joined for m in _MONTHS)
+    return _MONTH_RX.search(joined) is not None
 
 def _is_signal_line(tl: str) -> bool:
-    return (
-        any(k in tl for k in _VACCINE_HINTS)
-        or any(k in tl for k in _DOSE_HINTS)
-        or any(k in tl for k in _STATUS_HINTS)
-        or any(k in tl for k in _FACILITY_HINTS)
-        or any(k in tl for k in _BATCH_HINTS)
-        or _find_first_date(tl) is not None
-    )
+    return any(k in tl for k in _SIGNAL_KEYS) or _find_first_date(tl) is not None
 
 def _window(lines: List[str], i: int, span: int = 8) -> List[str]:
     a = max(0, i - 1)
@@ -178,7 +175,7 @@ def _extract_imm_from_window(win: List[str]) -> Dict[str, str]:
                     break
 
         if not vaccine:
-            if any(h in tl for h in _VACCINE_HINTS):
+            if any(h in tl for h in _VACCINE_KEYS):
                 vaccine = t
             elif t and t[0].isupper() and len(t) > 3 and ":" not in t and not tl.endswith(("am","pm")):
                 vaccine = t
@@ -231,13 +228,10 @@ def _extract_immunisations_from_page_state(state: Dict[str, Any]) -> List[Dict[s
         i += 1
 
     # dedupe on (vaccine, dose, date)
-    seen: set[Tuple[str,str,str]] = set()
-    uniq: List[Dict[str,str]] = []
+    uniq: Dict[Tuple[str,str,str], Dict[str,str]] = {}
     for it in items:
-        key = (it.get("vaccine",""), it.get("dose",""), it.get("date",""))
-        if key not in seen:
-            seen.add(key); uniq.append(it)
-    return uniq
+        uniq.setdefault((it.get("vaccine",""), it.get("dose",""), it.get("date","")), it)
+    return list(uniq.values())
 
 def _summarize(items: List[Dict[str, str]]) -> str:
     if not items: return "No immunisation records found."
@@ -285,7 +279,6 @@ class ImmReadState(TypedDict):
     messages: Annotated[List[AnyMessage], add_messages]
     prep_tries: int
     settle_tries: int
-    initial_wait_done: bool
 
 def build_immunisations_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optional[List] = None):
     if tools is None:
@@ -293,52 +286,40 @@ def build_immunisations_snapshot_reader_subgraph(page: Dict[str, Any], tools: Op
         tools = build_tools(page)
 
     def node(state: ImmReadState) -> ImmReadState:
-        state.setdefault("prep_tries", 0)
-        state.setdefault("settle_tries", 0)
-        state.setdefault("initial_wait_done", False)
+        # Counters are read into locals; updates are returned, never written into state
+        prep_tries = state.get("prep_tries", 0)
+        settle_tries = state.get("settle_tries", 0)
 
         # If we don't have a get_page_state payload yet, request one.
         if not (state.get("messages") and isinstance(state["messages"][-1], ToolMessage)
                 and getattr(state["messages"][-1], "name", "") == "get_page_state"):
-            if not state["initial_wait_done"] and IMM_GATE_INITIAL_MS > 0:
-                state["initial_wait_done"] = True
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", {"quietMs": min(IMM_GATE_INITIAL_MS, 1000), "timeout": IMM_GATE_INITIAL_MS + 2000}),
-                    _ai_tool_call("wait", {"ms": IMM_GATE_INITIAL_MS}),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
-            return {**state, "messages": [_ai_tool_call("get_page_state", {})]}
+            # Read right away: the extension posts a fresh snapshot just
+            # before /agent/run, so the first read needs no grace period
+            return {"messages": [_ai_tool_call("get_page_state", {})]}
 
         # We have a snapshot – decide whether to gate or extract.
         last = state["messages"][-1]
-        snap = _last_payload(last) or {}
+        snap = tool_payload(last) or {}
         url = (snap or {}).get("url", "")
         texts = snap.get("texts") or []
 
         # Stage 1: URL token gate
         if not _is_imm_url(url):
-            tries = state["prep_tries"] + 1
-            state["prep_tries"] = tries
+            tries = prep_tries + 1
+            prep_tries = tries
             log.info("[imm_read] waiting for immunisation URL (url=%s) try=%d/%d", url, tries, IMM_GATE_MAX_TRIES)
             if tries <= IMM_GATE_MAX_TRIES:
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", {"quietMs": 200, "timeout": 2000}),
-                    _ai_tool_call("wait", {"ms": IMM_GATE_POLL_MS}),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
+                return {"prep_tries": tries, "messages": [_ai_tool_call("get_page_state", _poll_snap(tries))]}
             log.info("[imm_read] immunisation URL gate timed out; continuing with current snapshot")
 
         # Stage 2: give the DOM a moment to settle after URL switch
         if IMM_SETTLE_TRIES > 0 and not _looks_structured(snap):
-            settles = state["settle_tries"] + 1
-            state["settle_tries"] = settles
+            settles = settle_tries + 1
+            settle_tries = settles
             log.info("[imm_read] settling DOM (url=%s, texts=%d) settle=%d/%d",
                      url, len(texts), settles, IMM_SETTLE_TRIES)
             if settles <= IMM_SETTLE_TRIES:
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", IDLE_HINT),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
+                return {"settle_tries": settles, "messages": [_ai_tool_call("get_page_state", _SETTLE_SNAP)]}
 
         # Extract & finish
         items = _extract_immunisations_from_page_state(snap)
@@ -350,9 +331,9 @@ def build_immunisations_snapshot_reader_subgraph(page: Dict[str, Any], tools: Op
             "tts": _tts_list(items),     # NEW: speech-friendly line(s)
             "items": items,
             "reason": f"Extracted {len(items)} immunisation record(s)",
-            "gated": (state.get("prep_tries", 0) > 0) or (state.get("settle_tries", 0) > 0),
-            "prep_tries": state.get("prep_tries", 0),
-            "settle_tries": state.get("settle_tries", 0),
+            "gated": (prep_tries > 0) or (settle_tries > 0),
+            "prep_tries": prep_tries,
+            "settle_tries": settle_tries,
         }
         pretty = (json.dumps(payload, ensure_ascii=False)[:MAX_LOG_CHARS]
                   if isinstance(payload, dict) else str(payload))
@@ -361,7 +342,7 @@ def build_immunisations_snapshot_reader_subgraph(page: Dict[str, Any], tools: Op
             print("[imm_read] extracted:", pretty)
         except Exception:
             pass
-        return {**state, "messages": [_ai_tool_call("done", payload)]}
+        return {"messages": [_ai_tool_call("done", payload)]}
 
     g = StateGraph(ImmReadState)
     g.add_node("imm_read", node)
@@ -10,7 +10,9 @@ from typing import Annotated, Dict, Any, List, Optional, TypedDict, Tuple
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
 from langgraph.graph.message import add_messages
-from langchain_core.messages import AnyMessage, AIMessage, ToolMessage
+from langchain_core.messages import AnyMessage, ToolMessage
+
+from app.adapter import ai_tool_call as _ai_tool_call, norm_lower as _lower, norm_text as _norm, tool_payload
 
 log = logging.getLogger(__name__)
 log.propagate = True
@@ -28,8 +30,8 @@ LAB_URL_TOKEN = os.getenv("LAB_SNAPSHOT_URL_TOKEN", "/lab-test-reports/lab")
 
 # Gate until URL shows the token
 LAB_GATE_MAX_TRIES   = int(os.getenv("LAB_GATE_MAX_TRIES", "12"))   # total polls for URL token
-LAB_GATE_POLL_MS     = int(os.getenv("LAB_GATE_POLL_MS", "250"))    # interval between polls
-LAB_GATE_INITIAL_MS  = int(os.getenv("LAB_GATE_INITIAL_MS", "300")) # one-time grace before first poll
+LAB_GATE_POLL_MS     = int(os.getenv("LAB_GATE_POLL_MS", "250"))    # max interval between polls
+LAB_GATE_POLL_MIN_MS = int(os.getenv("LAB_GATE_POLL_MIN_MS", "100")) # first poll interval; doubles per try
 
 # After URL token is seen, optionally do a few extra settle polls
 LAB_SETTLE_TRIES     = int(os.getenv("LAB_SETTLE_TRIES", "2"))
@@ -38,37 +40,32 @@ IDLE_HINT = {
     "timeout": int(os.getenv("LAB_IDLE_TIMEOUT_MS", "8000")),
 }
 
+# get_page_state args for retries: the pause runs inside the tool, right
+# before the snapshot is read, instead of as separate wait/wait_for_idle calls
+_SETTLE_SNAP = {"settle_ms": min(IDLE_HINT["quietMs"], IDLE_HINT["timeout"])}
+
+def _poll_snap(tries: int) -> Dict[str, int]:
+    """Adaptive backoff: short first poll, doubling up to LAB_GATE_POLL_MS."""
+    return {"settle_ms": min(LAB_GATE_POLL_MS, LAB_GATE_POLL_MIN_MS << max(tries - 1, 0))}
+
 # Optional structure checks (can be zeroed via env)
 MIN_HEADINGS = int(os.getenv("LAB_MIN_HEADINGS", "1"))
 MIN_LINKS    = int(os.getenv("LAB_MIN_LINKS", "5"))
 
-# ───────────────────────── tool-call shims ─────────────────────────
-def _ai_tool_call(name: str, args: dict) -> AIMessage:
-    return AIMessage(content="", tool_calls=[{
-        "id": f"call_{name}", "type": "tool_call", "name": name, "args": args or {}
-    }])
-
-def _last_payload(msg: ToolMessage) -> Dict[str, Any]:
-    try:
-        payload = json.loads(msg.content or "{}")
-    except Exception:
-        payload = {}
-    return payload.get("data", payload) or {}
-
 # ───────────────────────── readiness checks ─────────────────────────
+# URL gate tokens, lowercased once (env overrides may be mixed-case)
+_HOST_LC = TARGET_HOST.lower()
+_TOKEN_LC = LAB_URL_TOKEN.lower()
+
 def _is_lab_url(url: Optional[str]) -> bool:
-    if not isinstance(url, str):
-        return False
-    u = url.lower()
-    return (TARGET_HOST in u) and (LAB_URL_TOKEN in u)
-
-def _looks_structured(snap: Dict[str, Any]) -> bool:
-    links = snap.get("links") or {}
-    headings = snap.get("headings") or {}
+    return type(url) is str and _HOST_LC in (u := url.lower()) and _TOKEN_LC in u
+
+def _looks_structured(links: List[Any], headings: List[Any]) -> bool:
+    # links/headings are read once by the caller, which also logs their sizes
     return (len(headings) >= MIN_HEADINGS) and (len(links) >= MIN_LINKS)
 
 # ------------- extraction helpers -------------
-_LABELS = {"date:", "ordering facility:", "performing facility:"}
+_LABELS = ("date:", "ordering facility:", "performing facility:")
 _IRRELEVANT_EXACT = {
     "log out","healthier sg","health a-z","live healthy","mental wellbeing","parent hub",
     "health programmes","health services","filters","reset filters","switch","about",
@@ -76,16 +73,13 @@ _IRRELEVANT_EXACT = {
     "health e-services /","lab reports","note",
 }
 _DATE_RX = re.compile(r"\b(\d{1,2}\s+[A-Za-z]{3}\s+\d{4})\b")
-_WS = re.compile(r"\s+")
-
-def _norm(s: str) -> str:
-    return _WS.sub(" ", (s or "").strip())
 
 def _is_label(s: str) -> bool:
-    return _norm(s).lower() in _LABELS or any(_norm(s).lower().startswith(lbl) for lbl in _LABELS)
+    # exact label matches are a special case of the prefix test
+    return _lower(s).startswith(_LABELS)
 
 def _is_irrelevant(s: str) -> bool:
-    t = _norm(s).lower()
+    t = _lower(s)
     return (not t) or (t in _IRRELEVANT_EXACT) or (len(t) < 3)
 
 def _grab_after_colon(s: str) -> str:
@@ -135,11 +129,10 @@ def _extract_items_from_page_state(state: Dict[str, Any]) -> List[Dict[str, str]
             i = j
             continue
         i += 1
-    seen: set[Tuple[str,str,str,str]] = set(); uniq: List[Dict[str,str]] = []
+    uniq: Dict[Tuple[str,str,str,str], Dict[str,str]] = {}
     for it in items:
-        key = (it.get("test_name",""), it.get("date",""), it.get("ordering_facility",""), it.get("performing_facility",""))
-        if key not in seen: seen.add(key); uniq.append(it)
-    return uniq
+        uniq.setdefault((it.get("test_name",""), it.get("date",""), it.get("ordering_facility",""), it.get("performing_facility","")), it)
+    return list(uniq.values())
 
 def _summarize(items: List[Dict[str, str]]) -> str:
     if not items: return "No lab items found."
@@ -172,7 +165,6 @@ class LabReadState(TypedDict):
     messages: Annotated[List[AnyMessage], add_messages]
     prep_tries: int          # polls spent waiting for URL token
     settle_tries: int        # extra polls after URL token to let DOM settle
-    initial_wait_done: bool  # applied LAB_GATE_INITIAL_MS once
 
 def build_lab_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optional[List] = None):
     if tools is None:
@@ -180,56 +172,42 @@ def build_lab_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optional[Lis
         tools = build_tools(page)
 
     def node(state: LabReadState) -> LabReadState:
-        state.setdefault("prep_tries", 0)
-        state.setdefault("settle_tries", 0)
-        state.setdefault("initial_wait_done", False)
+        # Counters are read into locals; updates are returned, never written into state
+        prep_tries = state.get("prep_tries", 0)
+        settle_tries = state.get("settle_tries", 0)
 
         # If we don't have a get_page_state payload yet, request one.
         if not (state.get("messages") and isinstance(state["messages"][-1], ToolMessage)
                 and getattr(state["messages"][-1], "name", "") == "get_page_state"):
-            # First time in → an initial grace before first poll (once)
-            if not state["initial_wait_done"] and LAB_GATE_INITIAL_MS > 0:
-                state["initial_wait_done"] = True
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", {"quietMs": min(LAB_GATE_INITIAL_MS, 1000), "timeout": LAB_GATE_INITIAL_MS + 2000}),
-                    _ai_tool_call("wait", {"ms": LAB_GATE_INITIAL_MS}),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
-            # Otherwise, just get a snapshot
-            return {**state, "messages": [_ai_tool_call("get_page_state", {})]}
+            # Read right away: the extension posts a fresh snapshot just
+            # before /agent/run, so the first read needs no grace period
+            return {"messages": [_ai_tool_call("get_page_state", {})]}
 
         # We have a snapshot – decide whether to gate or extract.
         last = state["messages"][-1]
-        snap = _last_payload(last) or {}
+        snap = tool_payload(last) or {}
         url = (snap or {}).get("url", "")
         links = snap.get("links") or []
         headings = snap.get("headings") or []
 
         # Stage 1: URL token gate (only proceed once the lab URL is visible)
         if not _is_lab_url(url):
-            tries = state["prep_tries"] + 1
-            state["prep_tries"] = tries
+            tries = prep_tries + 1
+            prep_tries = tries
             log.info("[lab_read] waiting for lab URL (url=%s) try=%d/%d", url, tries, LAB_GATE_MAX_TRIES)
             if tries <= LAB_GATE_MAX_TRIES:
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", {"quietMs": 200, "timeout": 2000}),
-                    _ai_tool_call("wait", {"ms": LAB_GATE_POLL_MS}),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
+                return {"prep_tries": tries, "messages": [_ai_tool_call("get_page_state", _poll_snap(tries))]}
             # Timeout: proceed anyway with whatever we have
             log.info("[lab_read] lab URL gate timed out; continuing with current snapshot")
 
         # Stage 2 (optional): give the DOM a moment to settle after URL switch
-        if LAB_SETTLE_TRIES > 0 and not _looks_structured(snap):
-            settles = state["settle_tries"] + 1
-            state["settle_tries"] = settles
+        if LAB_SETTLE_TRIES > 0 and not _looks_structured(links, headings):
+            settles = settle_tries + 1
+            settle_tries = settles
             log.info("[lab_read] settling DOM (url=%s, links=%d, headings=%d) settle=%d/%d",
                      url, len(links), len(headings), settles, LAB_SETTLE_TRIES)
             if settles <= LAB_SETTLE_TRIES:
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", IDLE_HINT),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
+                return {"settle_tries": settles, "messages": [_ai_tool_call("get_page_state", _SETTLE_SNAP)]}
 
         # Extract & finish
         items = _extract_items_from_page_state(snap)
@@ -241,9 +219,9 @@ def build_lab_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optional[Lis
             "tts": _tts_list(items),     # NEW: TTS-friendly
             "items": items,
             "reason": f"Extracted {len(items)} lab item(s)",
-            "gated": (state.get("prep_tries", 0) > 0) or (state.get("settle_tries", 0) > 0),
-            "prep_tries": state.get("prep_tries", 0),
-            "settle_tries": state.get("settle_tries", 0),
+            "gated": (prep_tries > 0) or (settle_tries > 0),
+            "prep_tries": prep_tries,
+            "settle_tries": settle_tries,
         }
         pretty = (json.dumps(payload, ensure_ascii=False)[:MAX_LOG_CHARS]
                   if isinstance(payload, dict) else str(payload))
@@ -252,7 +230,7 @@ def build_lab_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optional[Lis
             print("[lab_read] extracted:", pretty)
         except Exception:
             pass
-        return {**state, "messages": [_ai_tool_call("done", payload)]}
+        return {"messages": [_ai_tool_call("done", payload)]}
 
     g = StateGraph(LabReadState)
     g.add_node("lab_read", node)
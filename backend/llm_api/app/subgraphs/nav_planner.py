@@ -0,0 +1,212 @@
+# app/subgraphs/nav_planner.py
+# Shared plan-once navigation subgraph. The lab/appointment/immunisation/payment
+# planners only differ in their find() query, LLM hint and log/done wording.
+from __future__ import annotations
+
+import os
+import orjson
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
+from typing import Annotated, Dict, Any, List, Optional, TypedDict
+
+from langgraph.graph import StateGraph, START, END
+from langgraph.prebuilt import ToolNode
+from langgraph.graph.message import add_messages
+from langchain_core.messages import AnyMessage, ToolMessage, HumanMessage, SystemMessage
+
+from app.adapter import (
+    ai_tool_call as _ai_tool_call, ai_tool_calls as _ai_tool_calls, extract_json, tool_payload,
+)
+from app.prompts import SELECTOR_INSTRUCTIONS
+from app.llm import make_llm, shared_cache_get, shared_cache_put  # LLM factory
+
+log = logging.getLogger(__name__)
+log.propagate = True
+if not log.handlers:
+    _h = logging.StreamHandler()
+    _h.setFormatter(logging.Formatter("%(levelname)s %(process)d %(name)s: %(message)s"))
+    log.addHandler(_h)
+log.setLevel(logging.INFO)
+
+# ───────────────────────── helpers ─────────────────────────
+def _goal_from_msgs(msgs: List[AnyMessage], default: str) -> str:
+    for m in msgs or []:
+        if isinstance(m, HumanMessage) and isinstance(m.content, str) and "GOAL:" in m.content:
+            try:
+                return m.content.split("GOAL:", 1)[1].strip()
+            except Exception:
+                pass
+    return default
+
+# ───────────────────────── LLM: choose ONE selector ─────────────────────────
+
+# Selector picks memoised on (workflow hint, goal, url, candidates): the same
+# ask on the same page gets the same click without another LLM round-trip.
+PLAN_CACHE = os.getenv("PLAN_CACHE", "1") == "1"
+_PLAN_CACHE_MAX = int(os.getenv("PLAN_CACHE_MAX", "512"))
+_PLAN_CACHE: "OrderedDict[tuple, str]" = OrderedDict()
+
+def _remember_plan(key: tuple, sel: str) -> None:
+    _PLAN_CACHE[key] = sel
+    if len(_PLAN_CACHE) > _PLAN_CACHE_MAX:
+        _PLAN_CACHE.popitem(last=False)
+
+def _loads_reply(raw: str) -> Any:
+    if raw.startswith("{"):
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass
+    return orjson.loads(extract_json(raw) or raw)
+
+@lru_cache(maxsize=None)
+def _selector_sys_msg(target: str, example: str, hint: str) -> SystemMessage:
+    # The workflow text is static, so it rides in the system prompt: the whole
+    # prefix is then identical across calls and only the user JSON varies.
+    instructions = SELECTOR_INSTRUCTIONS.format(target=target, example=example)
+    return SystemMessage(content=f"{instructions}\nHint: {hint}")
+
+async def _pick_selector_with_llm(tag: str, sys_msg: SystemMessage, hint: str, goal: str,
+                                  page_url: str, matches: List[Dict[str, Any]]) -> Optional[str]:
+    """Return a single CSS selector to click (or None)."""
+    if not matches:
+        return None
+    # compact candidate list
+    candidates = [
+        {"text": m.get("text") or "", "href": m.get("href") or "", "selector": m.get("selector") or ""}
+        for m in islice(matches, 10) if m
+    ]
+
+    key = None
+    if PLAN_CACHE:
+        key = (hint, goal.casefold().strip(), page_url,
+               tuple((c["text"], c["href"], c["selector"]) for c in candidates))
+        if (hit := _PLAN_CACHE.get(key)) is not None:
+            _PLAN_CACHE.move_to_end(key)
+            log.info("[%s] plan cache hit", tag)
+            return hit
+        if hit := await shared_cache_get("plan", key):
+            _remember_plan(key, hit)
+            return hit
+
+    llm = make_llm(temperature=0)
+    # orjson emits UTF-8 (non-ASCII kept as-is, like ensure_ascii=False)
+    usr = HumanMessage(content=orjson.dumps({
+        "goal": goal,
+        "page_url": page_url,
+        "candidates": candidates,
+    }).decode())
+
+    resp = await llm.ainvoke([sys_msg, usr])
+    raw = (getattr(resp, "content", None) or "").strip()
+    try:
+        # Strict-JSON replies skip the Python-level brace scan
+        obj = _loads_reply(raw)
+        sel = (obj.get("selector") or "").strip()
+        if sel and key is not None:
+            # only successful picks are cached; a miss may be a one-off bad reply
+            _remember_plan(key, sel)
+            await shared_cache_put("plan", key, sel)
+        return sel or None
+    except Exception:
+        log.warning("[%s] LLM selector parse failed: %r", tag, raw)
+        return None
+
+# ───────────────────────── State ─────────────────────────
+class NavPlanState(TypedDict):
+    messages: Annotated[List[AnyMessage], add_messages]
+    goal: str
+    planned: bool        # once we've planned, we just execute & finish
+    page_url: str        # last seen url (for LLM context)
+
+# ───────────────────────── Subgraph ─────────────────────────
+def build_nav_planner_subgraph(
+    page: Dict[str, Any],
+    tools: Optional[List],
+    *,
+    tag: str,
+    find_query: str,
+    hint: str,
+    example: str,
+    default_goal: str,
+    done_reason: str,
+    target: str = "best moves toward the goal",
+):
+    """
+    Plan-once, execute-once subgraph (navigation only):
+      1) get_page_state + find(find_query)
+      2) LLM picks ONE selector that `target`s, nudged by `hint` (`example`
+         is the sample selector shown in the instructions)
+      3) click
+      4) done(done_reason)
+    (Do NOT read snapshots here; the snapshot reader subgraph will poll/gate.)
+    `tag` prefixes log lines, e.g. "lab_plan".
+    """
+    if tools is None:
+        from ..tools import build_tools  # lazy import to avoid circulars
+        tools = build_tools(page)
+
+    find_args = {"query": find_query}
+    sys_msg = _selector_sys_msg(target, example, hint)
+
+    async def node(state: NavPlanState) -> NavPlanState:
+        # Read-only view of state; every change goes back as a partial update
+        msgs = state.get("messages") or []
+        goal = state["goal"] if "goal" in state else _goal_from_msgs(msgs, default_goal)
+        planned = state.get("planned", False)
+        page_url = state.get("page_url", "")
+
+        # If we just got a tool result, react; otherwise start
+        if msgs and isinstance(msgs[-1], ToolMessage):
+            last = msgs[-1]
+            name = (getattr(last, "name", "") or "").lower()
+
+            # After the snapshot+find batch → pick selector, schedule navigation-only tail
+            if (not planned) and name == "find":
+                # get_page_state ran in the same batch; its result sits just before find's
+                prev = msgs[-2] if len(msgs) > 1 else None
+                if isinstance(prev, ToolMessage) and prev.name == "get_page_state":
+                    snap = tool_payload(prev)
+                    if isinstance(snap, dict):
+                        page_url = snap.get("url") or page_url
+                data = tool_payload(last)  # only find's payload is needed here
+                matches = (data or {}).get("matches", []) if isinstance(data, dict) else []
+                sel = await _pick_selector_with_llm(tag, sys_msg, hint, goal, page_url, matches)
+                if not sel:
+                    # End gracefully to avoid loops
+                    return {"page_url": page_url,
+                            "messages": [_ai_tool_call("done", {"reason": "No selector chosen by planner"})]}
+                log.info("[%s] chosen selector: %s", tag, sel)
+                # IMPORTANT: navigation only — click then end. Snapshot gating happens in the reader.
+                return {"planned": True, "page_url": page_url, "messages": [_ai_tool_calls(
+                    ("click", {"selector": sel}),
+                    ("done", {"reason": done_reason}),
+                )]}
+
+            if name == "done":
+                return {}
+
+        # First entry: snapshot + candidate lookup in one batch (find reads the
+        # initial page, so it doesn't depend on the snapshot result)
+        return {"goal": goal, "messages": [_ai_tool_calls(
+            ("get_page_state", {}),
+            ("find", find_args),
+        )]}
+
+    # Graph wiring
+    g = StateGraph(NavPlanState)
+    g.add_node("planner", node)
+    g.add_node("tools", ToolNode(tools))
+    g.add_edge(START, "planner")
+    g.add_edge("planner", "tools")
+
+    def router_after_tools(state: NavPlanState):
+        last = state["messages"][-1]
+        if isinstance(last, ToolMessage) and (getattr(last, "name", "").lower() == "done"):
+            return END
+        return "planner"
+
+    g.add_conditional_edges("tools", router_after_tools, {"planner": "planner", END: END})
+    return g.compile()
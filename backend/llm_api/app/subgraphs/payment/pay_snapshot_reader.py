@@ -10,7 +10,9 @@ from typing import Annotated, Dict, Any, List, Optional, TypedDict, Tuple
 from langgraph.graph import StateGraph, START, END
 from langgraph.prebuilt import ToolNode
 from langgraph.graph.message import add_messages
-from langchain_core.messages import AnyMessage, AIMessage, ToolMessage
+from langchain_core.messages import AnyMessage, ToolMessage
+
+from app.adapter import ai_tool_call as _ai_tool_call, norm_text as _norm, tool_payload
 
 log = logging.getLogger(__name__)
 log.propagate = True
@@ -28,8 +30,8 @@ PAY_URL_TOKEN = os.getenv("PAY_SNAPSHOT_URL_TOKEN", "/payments")
 
 # Gate until URL shows the token
 PAY_GATE_MAX_TRIES   = int(os.getenv("PAY_GATE_MAX_TRIES", "12"))    # total polls for URL token
-PAY_GATE_POLL_MS     = int(os.getenv("PAY_GATE_POLL_MS", "250"))     # interval between polls
-PAY_GATE_INITIAL_MS  = int(os.getenv("PAY_GATE_INITIAL_MS", "300"))  # one-time grace before first poll
+PAY_GATE_POLL_MS     = int(os.getenv("PAY_GATE_POLL_MS", "250"))     # max interval between polls
+PAY_GATE_POLL_MIN_MS = int(os.getenv("PAY_GATE_POLL_MIN_MS", "100")) # first poll interval; doubles per try
 
 # After URL token is seen, optionally do a few extra settle polls
 PAY_SETTLE_TRIES     = int(os.getenv("PAY_SETTLE_TRIES", "2"))
@@ -38,43 +40,34 @@ IDLE_HINT = {
     "timeout": int(os.getenv("PAY_IDLE_TIMEOUT_MS", "8000")),
 }
 
+# get_page_state args for retries: the pause runs inside the tool, right
+# before the snapshot is read, instead of as separate wait/wait_for_idle calls
+_SETTLE_SNAP = {"settle_ms": min(IDLE_HINT["quietMs"], IDLE_HINT["timeout"])}
+
+def _poll_snap(tries: int) -> Dict[str, int]:
+    """Adaptive backoff: short first poll, doubling up to PAY_GATE_POLL_MS."""
+    return {"settle_ms": min(PAY_GATE_POLL_MS, PAY_GATE_POLL_MIN_MS << max(tries - 1, 0))}
+
 # Optional structure checks (can be zeroed via env)
 MIN_HEADINGS = int(os.getenv("PAY_MIN_HEADINGS", "1"))
 MIN_LINKS    = int(os.getenv("PAY_MIN_LINKS", "2"))
 
-# ───────────────────────── tool-call shims ─────────────────────────
-def _ai_tool_call(name: str, args: dict) -> AIMessage:
-    return AIMessage(content="", tool_calls=[{
-        "id": f"call_{name}", "type": "tool_call", "name": name, "args": args or {}
-    }])
-
-def _last_payload(msg: ToolMessage) -> Dict[str, Any]:
-    try:
-        payload = json.loads(msg.content or "{}")
-    except Exception:
-        payload = {}
-    return payload.get("data", payload) or {}
-
 # ───────────────────────── readiness checks ─────────────────────────
+# URL gate tokens, lowercased once (env overrides may be mixed-case)
+_HOST_LC = TARGET_HOST.lower()
+_TOKEN_LC = PAY_URL_TOKEN.lower()
+
 def _is_pay_url(url: Optional[str]) -> bool:
-    if not isinstance(url, str):
-        return False
-    u = url.lower()
-    return (TARGET_HOST in u) and (PAY_URL_TOKEN in u)
-
-def _looks_structured(snap: Dict[str, Any]) -> bool:
-    links = snap.get("links") or []
-    headings = snap.get("headings") or []
+    return type(url) is str and _HOST_LC in (u := url.lower()) and _TOKEN_LC in u
+
+def _looks_structured(links: List[Any], headings: List[Any]) -> bool:
+    # links/headings are read once by the caller, which also logs their sizes
     return (len(headings) >= MIN_HEADINGS) and (len(links) >= MIN_LINKS)
 
 # ───────────────────────── extraction helpers ─────────────────────────
-_WS = re.compile(r"\s+")
 # Accepts both "S$37.30" and potential encoded "S\$37.30" from text sources
 _MONEY_RX = re.compile(r"S\\$\s*\d{1,3}(?:,\d{3})*(?:\.\d{2})?|\bS\$\s*\d+(?:\.\d{2})?\b", re.I)
 
-def _norm(s: str) -> str:
-    return _WS.sub(" ", (s or "").strip())
-
 def _grab_amount(s: str) -> Optional[str]:
     m = _MONEY_RX.search(s.replace("\\", ""))
     return m.group(0) if m else None
@@ -105,13 +98,7 @@ def _extract_note(texts: List[str]) -> str:
             break
         i += 1
     # De-duplicate short pieces and join
-    uniq = []
-    seen = set()
-    for p in out:
-        if p not in seen:
-            uniq.append(p)
-            seen.add(p)
-    return " ".join(uniq).strip()
+    return " ".join(dict.fromkeys(out)).strip()
 
 def _extract_clusters_from_texts(texts: List[str]) -> List[Dict[str, str]]:
     """
@@ -172,14 +159,10 @@ def _extract_clusters_from_texts(texts: List[str]) -> List[Dict[str, str]]:
         i += 1
 
     # Deduplicate
-    uniq: List[Dict[str, str]] = []
-    seen: set[Tuple[str, str]] = set()
+    uniq: Dict[Tuple[str, str], Dict[str, str]] = {}
     for it in items:
-        key = (it.get("cluster", ""), it.get("amount", ""))
-        if key not in seen:
-            uniq.append(it)
-            seen.add(key)
-    return uniq
+        uniq.setdefault((it.get("cluster", ""), it.get("amount", "")), it)
+    return list(uniq.values())
 
 def _scan_cards_globally(texts: List[str]) -> List[Dict[str, str]]:
     """
@@ -219,14 +202,10 @@ def _scan_cards_globally(texts: List[str]) -> List[Dict[str, str]]:
         i += 1
 
     # Deduplicate
-    uniq: List[Dict[str, str]] = []
-    seen: set[Tuple[str, str]] = set()
+    uniq: Dict[Tuple[str, str], Dict[str, str]] = {}
     for it in items:
-        key = (it.get("cluster", ""), it.get("amount", ""))
-        if key not in seen:
-            uniq.append(it)
-            seen.add(key)
-    return uniq
+        uniq.setdefault((it.get("cluster", ""), it.get("amount", "")), it)
+    return list(uniq.values())
 
 def _extract_from_snapshot(snap: Dict[str, Any]) -> Dict[str, Any]:
     texts_raw = snap.get("texts") or []
@@ -294,7 +273,6 @@ class PayReadState(TypedDict):
     messages: Annotated[List[AnyMessage], add_messages]
     prep_tries: int          # polls spent waiting for URL token
     settle_tries: int        # extra polls after token to let DOM settle
-    initial_wait_done: bool  # applied PAY_GATE_INITIAL_MS once
 
 def build_payments_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optional[List] = None):
     if tools is None:
@@ -302,56 +280,42 @@ def build_payments_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optiona
         tools = build_tools(page)
 
     def node(state: PayReadState) -> PayReadState:
-        state.setdefault("prep_tries", 0)
-        state.setdefault("settle_tries", 0)
-        state.setdefault("initial_wait_done", False)
+        # Counters are read into locals; updates are returned, never written into state
+        prep_tries = state.get("prep_tries", 0)
+        settle_tries = state.get("settle_tries", 0)
 
         # If we don't have a get_page_state payload yet, request one.
         if not (state.get("messages") and isinstance(state["messages"][-1], ToolMessage)
                 and getattr(state["messages"][-1], "name", "") == "get_page_state"):
-            # First time in → an initial grace before first poll (once)
-            if not state["initial_wait_done"] and PAY_GATE_INITIAL_MS > 0:
-                state["initial_wait_done"] = True
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", {"quietMs": min(PAY_GATE_INITIAL_MS, 1000), "timeout": PAY_GATE_INITIAL_MS + 2000}),
-                    _ai_tool_call("wait", {"ms": PAY_GATE_INITIAL_MS}),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
-            # Otherwise, just get a snapshot
-            return {**state, "messages": [_ai_tool_call("get_page_state", {})]}
+            # Read right away: the extension posts a fresh snapshot just
+            # before /agent/run, so the first read needs no grace period
+            return {"messages": [_ai_tool_call("get_page_state", {})]}
 
         # We have a snapshot – decide whether to gate or extract.
         last = state["messages"][-1]
-        snap = _last_payload(last) or {}
+        snap = tool_payload(last) or {}
         url = (snap or {}).get("url", "")
         links = snap.get("links") or []
         headings = snap.get("headings") or []
 
         # Stage 1: URL token gate (only proceed once the payments URL is visible)
         if not _is_pay_url(url):
-            tries = state["prep_tries"] + 1
-            state["prep_tries"] = tries
+            tries = prep_tries + 1
+            prep_tries = tries
             log.info("[pay_read] waiting for payments URL (url=%s) try=%d/%d", url, tries, PAY_GATE_MAX_TRIES)
             if tries <= PAY_GATE_MAX_TRIES:
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", {"quietMs": 200, "timeout": 2000}),
-                    _ai_tool_call("wait", {"ms": PAY_GATE_POLL_MS}),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
+                return {"prep_tries": tries, "messages": [_ai_tool_call("get_page_state", _poll_snap(tries))]}
             # Timeout: proceed anyway with whatever we have
             log.info("[pay_read] payments URL gate timed out; continuing with current snapshot")
 
         # Stage 2 (optional): give the DOM a moment to settle after URL switch
-        if PAY_SETTLE_TRIES > 0 and not _looks_structured(snap):
-            settles = state["settle_tries"] + 1
-            state["settle_tries"] = settles
+        if PAY_SETTLE_TRIES > 0 and not _looks_structured(links, headings):
+            settles = settle_tries + 1
+            settle_tries = settles
             log.info("[pay_read] settling DOM (url=%s, links=%d, headings=%d) settle=%d/%d",
                      url, len(links), len(headings), settles, PAY_SETTLE_TRIES)
             if settles <= PAY_SETTLE_TRIES:
-                return {**state, "messages": [
-                    _ai_tool_call("wait_for_idle", IDLE_HINT),
-                    _ai_tool_call("get_page_state", {}),
-                ]}
+                return {"settle_tries": settles, "messages": [_ai_tool_call("get_page_state", _SETTLE_SNAP)]}
 
         # Extract & finish
         extracted = _extract_from_snapshot(snap)
@@ -361,9 +325,9 @@ def build_payments_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optiona
             **extracted,
             "tts": tts,  # NEW: speech-friendly one-liner(s)
             "reason": f"Extracted {extracted.get('count', 0)} cluster bill item(s)",
-            "gated": (state.get("prep_tries", 0) > 0) or (state.get("settle_tries", 0) > 0),
-            "prep_tries": state.get("prep_tries", 0),
-            "settle_tries": state.get("settle_tries", 0),
+            "gated": (prep_tries > 0) or (settle_tries > 0),
+            "prep_tries": prep_tries,
+            "settle_tries": settle_tries,
         }
         pretty = (json.dumps(payload, ensure_ascii=False)[:MAX_LOG_CHARS]
                   if isinstance(payload, dict) else str(payload))
@@ -372,7 +336,7 @@ def build_payments_snapshot_reader_subgraph(page: Dict[str, Any], tools: Optiona
             print("[pay_read] extracted:", pretty)
         except Exception:
             pass
-        return {**state, "messages": [_ai_tool_call("done", payload)]}
+        return {"messages": [_ai_tool_call("done", payload)]}
 
     g = StateGraph(PayReadState)
     g.add_node("pay_read", node)
@@ -1,14 +1,18 @@
 # app/supervisor.py
 from __future__ import annotations
-import json, logging, re, os, time
+import asyncio, logging, re, os, threading
+from collections import OrderedDict
 from typing import Annotated, Dict, Any, List, Optional, TypedDict
 
+import orjson
+import xxhash
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langchain_core.messages import AnyMessage, SystemMessage, HumanMessage
+from langchain_core.messages import AnyMessage, HumanMessage
 
 from .tools import build_tools
-from .llm import make_llm
+from .llm import make_llm, shared_cache_get, shared_cache_put
+from .prompts import DECISION_SYS_MSG
 
 # Subgraphs: navigation
 from .subgraphs.lab.lab_records import build_lab_records_subgraph
@@ -41,56 +45,60 @@ IMM_URL_TOKEN   = "/immunisation"
 PAY_URL_TOKEN   = "/payments"
 
 def _is_lab_url(url: Optional[str]) -> bool:
-    return isinstance(url, str) and (TARGET_HOST in url.lower()) and (LAB_URL_TOKEN in url.lower())
+    return type(url) is str and TARGET_HOST in (u := url.lower()) and LAB_URL_TOKEN in u
 def _is_appt_url(url: Optional[str]) -> bool:
-    return isinstance(url, str) and (TARGET_HOST in url.lower()) and (APPT_URL_TOKEN in url.lower())
+    return type(url) is str and TARGET_HOST in (u := url.lower()) and APPT_URL_TOKEN in u
 def _is_imm_url(url: Optional[str]) -> bool:
-    return isinstance(url, str) and (TARGET_HOST in url.lower()) and (IMM_URL_TOKEN in url.lower())
+    return type(url) is str and TARGET_HOST in (u := url.lower()) and IMM_URL_TOKEN in u
 def _is_pay_url(url: Optional[str]) -> bool:
-    return isinstance(url, str) and (TARGET_HOST in url.lower()) and (PAY_URL_TOKEN in url.lower())
+    return type(url) is str and TARGET_HOST in (u := url.lower()) and PAY_URL_TOKEN in u
 
 # ───────────────────────── login heuristics ─────────────────────────
 def _lower_list(x):
     return [str(i).lower() for i in x] if isinstance(x, list) else []
 
-def _html_contains(page: Dict[str, Any], needle: str) -> bool:
+def _page_html_lc(page: Dict[str, Any]) -> str:
+    """Lowercased page html. Compute once per check and test every marker
+    against it with plain `in`, which beats a combined regex pass."""
     html = page.get("html") or ""
     try:
-        return needle.lower() in str(html).lower()
+        return str(html).lower()
     except Exception:
-        return False
+        return ""
+
+_SINGPASS_URL_MARKERS = ("singpass", "login.singpass", "authorize", "oauth", "account/login")
 
-def _looks_like_singpass_redirect(page: Dict[str, Any]) -> bool:
+def _looks_like_singpass_redirect(page: Dict[str, Any], html_lc: Optional[str] = None) -> bool:
     url = (page.get("url") or "").lower()
-    if any(k in url for k in ["singpass", "login.singpass", "authorize", "oauth", "account/login"]):
+    if any(k in url for k in _SINGPASS_URL_MARKERS):
         return True
     tb = _lower_list(page.get("top_buttons", []))
     tl = _lower_list(page.get("top_links", []))
     if any("singpass" in t for t in (tb + tl)):
         return True
-    if _html_contains(page, "singpass"):
-        return True
-    return False
+    if html_lc is None:
+        html_lc = _page_html_lc(page)
+    return "singpass" in html_lc
 
-def _looks_logged_in(page: Dict[str, Any]) -> bool:
+def _looks_logged_in(page: Dict[str, Any], html_lc: Optional[str] = None) -> bool:
     if not isinstance(page, dict):
         return False
     session = page.get("session") or {}
     if isinstance(session, dict) and session.get("is_authenticated") is True:
         return True
-    if _html_contains(page, 'sslIsAnonymous') and _html_contains(page, 'sslIsAnonymous = "True"'):
-        return False
-    if _html_contains(page, 'btn-login'):
+    if html_lc is None:
+        html_lc = _page_html_lc(page)
+    if 'sslisanonymous = "true"' in html_lc or "btn-login" in html_lc:
         return False
-    tb = _lower_list(page.get("top_buttons", []))
-    tl = _lower_list(page.get("top_links", []))
-    if any("login" in t for t in (tb + tl)):
+    tbl = _lower_list(page.get("top_buttons", [])) + _lower_list(page.get("top_links", []))
+    if any("login" in t for t in tbl):
         return False
     headings = _lower_list(page.get("top_headings", []))
-    if any(h for h in (tb + tl + headings) if ("logout" in h or "my profile" in h or "welcome" in h or h.startswith("hi "))):
+    if any(h for h in (tbl + headings) if ("logout" in h or "my profile" in h or "welcome" in h or h.startswith("hi "))):
         return True
     url = (page.get("url") or "").lower()
-    if TARGET_HOST in url and "login" not in url and not any("login" in t for t in (tb + tl)):
+    # no button/link mentions login here, or we'd have returned above
+    if TARGET_HOST in url and "login" not in url:
         return True
     return False
 
@@ -107,9 +115,12 @@ _GOAL_RE = re.compile(r"^\s*GOAL:\s*(.*)$", re.I)
 _PAGE_RE = re.compile(r"^\s*PAGE_STATE:\s*(\{.*\})\s*$", re.I)
 
 def _extract_goal_and_page_from_messages(msgs: List[AnyMessage]) -> tuple[str, Dict[str, Any]]:
+    """Fallback for callers that don't seed goal/page in state (run_plan_once does)."""
     goal = ""
     page: Dict[str, Any] = {}
     for m in msgs or []:
+        if goal and page:
+            break
         if hasattr(m, "content"):
             t = (m.content or "").strip()
             if not goal:
@@ -120,33 +131,173 @@ def _extract_goal_and_page_from_messages(msgs: List[AnyMessage]) -> tuple[str, D
                 p = _PAGE_RE.match(t)
                 if p:
                     try:
-                        page = json.loads(p.group(1))
+                        page = orjson.loads(p.group(1))
                     except Exception:
                         page = {}
     return goal, page
 
+_ROUTE_TOKENS = frozenset({"lab_results", "appointments", "payments", "immunisations"})
+
+# Goals that already name a workflow outright (the popup's default goal is
+# "view lab results"); these route without asking the LLM. Keys are _route_key-normalised.
+_CANONICAL_GOALS: Dict[str, str] = {
+    **{t: t for t in _ROUTE_TOKENS},
+    "lab results": "lab_results", "lab result": "lab_results", "lab reports": "lab_results",
+    "lab report": "lab_results", "my lab results": "lab_results", "view lab results": "lab_results",
+    "appointment": "appointments", "my appointments": "appointments", "view appointments": "appointments",
+    "payment": "payments", "bills": "payments", "my bills": "payments", "pay bills": "payments",
+    "view bills": "payments", "view payments": "payments",
+    "immunisation": "immunisations", "immunization": "immunisations",
+    "immunizations": "immunisations", "vaccinations": "immunisations",
+    "my immunisations": "immunisations", "view immunisations": "immunisations",
+    "vaccination records": "immunisations",
+}
+
+# Fuzzy route fallbacks, checked in order when the reply isn't an exact token
+_ROUTE_FALLBACKS = (
+    (re.compile(r"\blab"), "lab_results"),
+    (re.compile(r"\bappoint"), "appointments"),
+    (re.compile(r"\bpay|bill|invoice"), "payments"),
+    (re.compile(r"\bimmuni|vaccin|booster|jab|shot"), "immunisations"),
+)
+
 def _normalize_route(text: str) -> Optional[str]:
     t = (text or "").strip().lower().replace('"','').replace("'","")
     try:
         if t.startswith("{"):
-            obj = json.loads(t)
+            obj = orjson.loads(t)
             t = (obj.get("route") or obj.get("choice") or obj.get("workflow") or "").strip().lower()
     except Exception:
         pass
-    if t in {"lab_results", "appointments", "payments", "immunisations"}:
+    if t in _ROUTE_TOKENS:
         return t
-    if re.search(r"\blab", t):
-        return "lab_results"
-    if re.search(r"\bappoint", t):
-        return "appointments"
-    if re.search(r"\bpay|bill|invoice", t):
-        return "payments"
-    if re.search(r"\bimmuni|vaccin|booster|jab|shot", t):
-        return "immunisations"
+    for rx, route in _ROUTE_FALLBACKS:
+        if rx.search(t):
+            return route
     return None
 
+# decide() route → graph node
+_ROUTE_NODES = {
+    "lab_results": "lab",
+    "appointments": "appointments",
+    "immunisations": "immunisations",
+    "payments": "payments",
+    "lab_read": "lab_read",
+    "appt_read": "appt_read",
+    "imm_read": "imm_read",
+    "pay_read": "pay_read",
+}
+
+# Router decisions memoised on (normalised goal, url): the app is rebuilt per
+# request, so this lives at module level. Repeat phrasings skip the LLM call.
+_ROUTE_CACHE_MAX = int(os.getenv("ROUTE_CACHE_MAX", "1024"))
+_ROUTE_CACHE: "OrderedDict[tuple[str, str], str]" = OrderedDict()
+
+def _route_cache_get(key: tuple[str, str]) -> Optional[str]:
+    route = _ROUTE_CACHE.get(key)
+    if route is not None:
+        _ROUTE_CACHE.move_to_end(key)
+    return route
+
+def _route_cache_put(key: tuple[str, str], route: str) -> None:
+    _ROUTE_CACHE[key] = route
+    _ROUTE_CACHE.move_to_end(key)
+    if len(_ROUTE_CACHE) > _ROUTE_CACHE_MAX:
+        _ROUTE_CACHE.popitem(last=False)
+
+def _route_key(goal: str, url: str) -> tuple[str, str]:
+    return " ".join(goal.lower().split()), url
+
+# Router LLM calls in flight, so a prefetch and decide() (or two identical
+# concurrent requests) share one round-trip.
+_ROUTE_INFLIGHT: "Dict[tuple[str, str], asyncio.Task[Optional[str]]]" = {}
+
+async def _llm_route(goal: str, url: str) -> Optional[str]:
+    """Router LLM pick, or None when the reply doesn't name a workflow."""
+    key = _route_key(goal, url)
+    if (route := await shared_cache_get("route", key)) in _ROUTE_TOKENS:
+        return route
+    usr = HumanMessage(content=f"Goal: {goal}\nURL: {url}")
+    raw = ((await make_llm(temperature=0).ainvoke([DECISION_SYS_MSG, usr])).content or "").strip()
+    route = _normalize_route(raw)
+    log.info("[supervisor] router raw=%r → %s", raw, route)
+    if route is not None:
+        await shared_cache_put("route", key, route)
+    return route
+
+def _route_done(key: tuple[str, str], task: "asyncio.Task[Optional[str]]") -> None:
+    if _ROUTE_INFLIGHT.get(key) is task:
+        del _ROUTE_INFLIGHT[key]
+    # only parsed routes are cached; an unparsable reply may be a one-off
+    if not task.cancelled() and task.exception() is None and task.result() is not None:
+        _route_cache_put(key, task.result())
+
+def _route_task(key: tuple[str, str], goal: str, url: str) -> "asyncio.Task[Optional[str]]":
+    task = _ROUTE_INFLIGHT.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.get_running_loop().create_task(_llm_route(goal, url))
+        task.add_done_callback(lambda t, k=key: _route_done(k, t))
+        _ROUTE_INFLIGHT[key] = task
+    return task
+
+def prefetch_route(goal: str, url: str) -> None:
+    """Start the router call now (e.g. while the app compiles); decide() joins it."""
+    key = _route_key(goal, url)
+    if key[0] not in _CANONICAL_GOALS and _route_cache_get(key) is None:
+        _route_task(key, goal, url)
+
+async def resolve_route(goal: str, url: str) -> str:
+    """Workflow route for (goal, url): canonical goal, cached, in flight, or a new LLM call."""
+    key = _route_key(goal, url)
+    if (route := _CANONICAL_GOALS.get(key[0])) is not None:
+        # Goal already names a workflow: nothing for the router to decide.
+        return route
+    if (route := _route_cache_get(key)) is not None:
+        log.info("[supervisor] route cache hit: %s", route)
+        return route
+    # shield: one cancelled waiter mustn't cancel the shared call
+    route = await asyncio.shield(_route_task(key, goal, url))
+    return route or "appointments"
+
 # ───────────────────────── builder ─────────────────────────
+def _as_node(subgraph):
+    """Wrap a compiled subgraph as an async node so its LLM/tool calls never block the loop."""
+    async def run(state):
+        return await subgraph.ainvoke(state)
+    return run
+
+# Compiled apps memoised on page content: everything page-dependent lives in
+# the tools, so an identical snapshot yields an identical graph. Nine
+# subgraph compiles per request become a hash + dict lookup on repeats.
+_APP_CACHE_MAX = int(os.getenv("APP_CACHE_MAX", "32"))
+_APP_CACHE: "OrderedDict[int, Any]" = OrderedDict()
+_APP_CACHE_LOCK = threading.Lock()  # builds may run in worker threads
+
+def _page_fingerprint(page: dict) -> Optional[int]:
+    try:
+        blob = orjson.dumps(page or {}, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        return None  # not JSON-able; build uncached
+    # In-process key only, so a fast non-cryptographic 128-bit hash is enough
+    return xxhash.xxh3_128_intdigest(blob)
+
 def build_supervisor_app(page: dict):
+    fp = _page_fingerprint(page)
+    if fp is not None:
+        with _APP_CACHE_LOCK:
+            if (app := _APP_CACHE.get(fp)) is not None:
+                _APP_CACHE.move_to_end(fp)
+                log.info("[supervisor] app cache hit %012x", fp >> 80)
+                return app
+    app = _build_supervisor_app(page)
+    if fp is not None:
+        with _APP_CACHE_LOCK:
+            _APP_CACHE[fp] = app
+            if len(_APP_CACHE) > _APP_CACHE_MAX:
+                _APP_CACHE.popitem(last=False)
+    return app
+
+def _build_supervisor_app(page: dict):
     log.info("[supervisor] building shared tools")
     tools = build_tools(page)
 
@@ -162,26 +313,8 @@ def build_supervisor_app(page: dict):
     pay_read_g  = build_payments_snapshot_reader_subgraph(page, tools)
     log.info("[supervisor] subgraphs compiled")
 
-    llm = make_llm(temperature=0)
-
-    DECISION_INSTRUCTIONS = (
-        "You are a router. Read the user's goal and choose exactly one workflow.\n"
-        "Valid outputs:\n"
-        "  - lab_results\n"
-        "  - appointments\n"
-        "  - payments\n"
-        "  - immunisations\n\n"
-        "Rules:\n"
-        "  • Reply with ONLY one of the four tokens above. No explanations.\n"
-        "  • If the goal involves viewing lab results, lab reports, blood tests, pathology → lab_results.\n"
-        "  • If it involves booking, rescheduling, or checking appointment slots → appointments.\n"
-        "  • If it involves paying bills, invoices, fees, or making a payment → payments.\n"
-        "  • If it involves vaccines, immunisations, boosters, jabs, shots → immunisations.\n"
-        "  • If ambiguous, pick the most likely.\n"
-    )
-
     # ── Step 1: Decide (what to run THIS turn)
-    def decide(state: SupervisorState) -> SupervisorState:
+    async def decide(state: SupervisorState) -> SupervisorState:
         goal = (state.get("goal") or "").strip()
         page0 = state.get("page") or {}
         if not goal or not page0:
@@ -192,10 +325,7 @@ def build_supervisor_app(page: dict):
         url = (page0.get("url") or "")
         log.info("[supervisor] deciding route for goal=%r url=%s", goal, url)
 
-        sys = SystemMessage(content=DECISION_INSTRUCTIONS)
-        usr = HumanMessage(content=f"Goal: {goal}\nURL: {url}")
-        raw = (llm.invoke([sys, usr]).content or "").strip()
-        route = _normalize_route(raw) or "appointments"
+        route = await resolve_route(goal, url)
 
         # ── IMPORTANT: if we're ALREADY on a target page, jump straight to the reader on this run.
         if route == "lab_results" and _is_lab_url(url):
@@ -207,39 +337,31 @@ def build_supervisor_app(page: dict):
         elif route == "payments" and _is_pay_url(url):
             route = "pay_read"
 
-        log.info("[supervisor] route=%s (raw=%r)", route, raw)
-        return {**state, "route": route, "goal": goal, "page": page0}
+        log.info("[supervisor] route=%s", route)
+        return {"route": route, "goal": goal, "page": page0}
 
     def router(state: SupervisorState):
-        r = state.get("route")
-        if r == "lab_results": return "lab"
-        if r == "appointments": return "appointments"
-        if r == "immunisations": return "immunisations"
-        if r == "payments": return "payments"
-        if r == "lab_read": return "lab_read"
-        if r == "appt_read": return "appt_read"
-        if r == "imm_read": return "imm_read"
-        if r == "pay_read": return "pay_read"
-        return "appointments"
+        return _ROUTE_NODES.get(state.get("route"), "appointments")
 
     # ── Step 2: Post-navigation login gate (only for NAV nodes)
     def post_nav_login_check(state: SupervisorState) -> SupervisorState:
         page_now = state.get("page") or {}
-        logged_in = _looks_logged_in(page_now)
-        singpass  = _looks_like_singpass_redirect(page_now)
+        html_lc = _page_html_lc(page_now)
+        logged_in = _looks_logged_in(page_now, html_lc)
+        singpass  = _looks_like_singpass_redirect(page_now, html_lc)
         url = (page_now.get("url") or "")
         log.info("[supervisor] post_nav_login_check: logged_in=%s singpass=%s url=%s", logged_in, singpass, url)
         need_login = (singpass or not logged_in)
-        return {**state, "route": ("login_needed" if need_login else "nav_ok")}
+        return {"route": ("login_needed" if need_login else "nav_ok")}
 
     def post_nav_router(state: SupervisorState):
         return state.get("route")  # "login_needed" | "nav_ok"
 
-    def pause_before_lab_read(state: SupervisorState) -> SupervisorState:
+    async def pause_before_lab_read(state: SupervisorState) -> SupervisorState:
         if LAB_SNAPSHOT_DELAY_MS > 0:
             log.info("[supervisor] pausing %d ms before read to allow snapshot to persist", LAB_SNAPSHOT_DELAY_MS)
-            time.sleep(LAB_SNAPSHOT_DELAY_MS / 1000.0)
-        return state
+            await asyncio.sleep(LAB_SNAPSHOT_DELAY_MS / 1000.0)
+        return {}
 
     # ───────────────────────── graph ─────────────────────────
     g = StateGraph(SupervisorState)
@@ -248,19 +370,19 @@ def build_supervisor_app(page: dict):
     g.add_node("decide", decide)
 
     # Navigation (pass 1)
-    g.add_node("lab",           lambda s: lab_g.invoke(s))
-    g.add_node("appointments",  lambda s: appt_g.invoke(s))
-    g.add_node("immunisations", lambda s: imm_g.invoke(s))
-    g.add_node("payments",      lambda s: pay_g.invoke(s))
+    g.add_node("lab",           _as_node(lab_g))
+    g.add_node("appointments",  _as_node(appt_g))
+    g.add_node("immunisations", _as_node(imm_g))
+    g.add_node("payments",      _as_node(pay_g))
 
     # Login gate
     g.add_node("post_nav_login_check", post_nav_login_check)
 
     # Readers (pass 2)
-    g.add_node("lab_read",      lambda s: lab_read_g.invoke(s))
-    g.add_node("appt_read",     lambda s: appt_read_g.invoke(s))
-    g.add_node("imm_read",      lambda s: imm_read_g.invoke(s))
-    g.add_node("pay_read",      lambda s: pay_read_g.invoke(s))
+    g.add_node("lab_read",      _as_node(lab_read_g))
+    g.add_node("appt_read",     _as_node(appt_read_g))
+    g.add_node("imm_read",      _as_node(imm_read_g))
+    g.add_node("pay_read",      _as_node(pay_read_g))
     g.add_node("pause_before_lab_read", pause_before_lab_read)
 
     # Edges
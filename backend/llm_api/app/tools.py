@@ -1,12 +1,15 @@
 # app/tools.py
 from __future__ import annotations
 
-import json
+import asyncio
+import heapq
 import re
 import time
 import threading
-from typing import Any, Dict, List, Optional
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
 
+import orjson
 from pydantic import BaseModel, Field
 from langchain_core.tools import StructuredTool
 
@@ -18,9 +21,15 @@ from langchain_core.tools import StructuredTool
 _BRIDGE_LOCK = threading.Lock()
 # Store as a dict with {"snap": <snapshot dict>, "ts": <float>} to support
 # sticky upgrades and prevent lower-quality pages from overwriting better ones.
+# "json" memoises the encoded snapshot; readers poll the same one repeatedly.
 _LATEST_SNAPSHOT: Optional[Dict[str, Any]] = None
 
 
+def _dumps(obj: Any) -> str:
+    # Tool results are parsed back with orjson by the subgraphs; encode with it too
+    return orjson.dumps(obj).decode()
+
+
 def _rank_url(url: Optional[str]) -> int:
     """Higher rank is 'better'. Prefer specific Lab page over generic Home."""
     u = (url or "").lower()
@@ -54,7 +63,7 @@ def set_latest_snapshot(snap: Dict[str, Any]) -> None:
 
         accept = (now >= prev_ts) and (new_rank >= prev_rank)
         if accept:
-            _LATEST_SNAPSHOT = {"snap": snap, "ts": now}
+            _LATEST_SNAPSHOT = {"snap": snap, "ts": now, "json": None}
             try:
                 print(f"[bridge] ACCEPT {new_url} (rank {new_rank}) ts={now}")
             except Exception:
@@ -78,7 +87,21 @@ def get_latest_snapshot() -> Optional[Dict[str, Any]]:
         return snap.copy()
 
 
+def get_latest_snapshot_json() -> Optional[Tuple[str, Optional[str]]]:
+    """(encoded snapshot, url) for the latest bridge snapshot, encoding it at most once."""
+    with _BRIDGE_LOCK:
+        if not _LATEST_SNAPSHOT or not _LATEST_SNAPSHOT.get("snap"):
+            return None
+        snap = _LATEST_SNAPSHOT["snap"]
+        if _LATEST_SNAPSHOT.get("json") is None:
+            _LATEST_SNAPSHOT["json"] = _dumps(snap)
+        return _LATEST_SNAPSHOT["json"], snap.get("url")
+
+
 # ────────────────────────── Tool factory ─────────────────────────────────────
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
 def build_tools(page: Dict[str, Any]) -> List[StructuredTool]:
     """
     Return the toolset used by graphs/subgraphs.
@@ -111,65 +134,91 @@ def build_tools(page: Dict[str, Any]) -> List[StructuredTool]:
         quietMs: Optional[int] = Field(default=600, ge=0, le=60000)
         timeout: Optional[int] = Field(default=3000, ge=0, le=180000)
 
+    class PageStateInput(BaseModel):
+        # Optional pause before reading, so a wait + snapshot is one tool call
+        settle_ms: Optional[int] = Field(default=0, ge=0, le=60000, description="Wait this long before reading (milliseconds)")
+
     class DoneInput(BaseModel):
         reason: str
 
-    class EmptyInput(BaseModel):
-        """Schema for tools with no args (e.g., get_page_state)."""
-        pass
-
     # ── Helpers for proxy find() over the *provided* `page` snapshot ─────────
     def _canon(s: str) -> str:
-        return re.sub(r"[^a-z0-9]+", " ", (s or "").lower()).strip()
-
-    def _overlap(a: str, b: str) -> int:
-        A = set(_canon(a).split())
-        B = set(_canon(b).split())
-        return len(A & B)
-
-    def _search(q: str) -> List[Dict[str, Any]]:
+        return _NON_ALNUM_RE.sub(" ", (s or "").lower()).strip()
+
+    # Column-wise view of the page elements, built on first find(): the page is
+    # fixed for this toolset, so canonical text/selector and token sets are
+    # computed once per element instead of once per element per query.
+    _cols: Dict[str, list] = {}
+
+    def _columns() -> Dict[str, list]:
+        if _cols:
+            return _cols
+        kinds, items, texts, canons, tokens, sels, shown_tokens, sel_lens = ([] for _ in range(8))
+        for kind, els in (("button", page.get("buttons")), ("link", page.get("links")),
+                          ("input", page.get("inputs"))):
+            for el in els or []:
+                text = el.get("text") or el.get("name") or ""
+                tl = _canon(el.get("text", ""))
+                tt = frozenset(tl.split())
+                kinds.append(kind)
+                items.append(el)
+                if kind == "input":
+                    canons.append(" ".join([el.get("name", ""), el.get("placeholder", ""),
+                                            el.get("selector", "")]).lower())
+                    tokens.append(None)
+                    sels.append("")
+                else:
+                    canons.append(tl)
+                    tokens.append(tt)
+                    sels.append(_canon(el.get("selector", "")))
+                texts.append(text)
+                shown_tokens.append(tt if text == el.get("text", "") else frozenset(_canon(text).split()))
+                sel_lens.append(-len(el.get("selector", "") or ""))
+        _cols.update(kind=kinds, item=items, text=texts, canon=canons, tokens=tokens,
+                     sel=sels, shown_tokens=shown_tokens, sel_len=sel_lens)
+        return _cols
+
+    def _search(q: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Single pass over the precomputed element columns; match test and
+        ranking score are computed together. Only the top `limit` hits are
+        materialised; the total hit count is returned too."""
         ql = _canon(q)
-        out: List[Dict[str, Any]] = []
-
-        def add(kind: str, item: Dict[str, Any]) -> None:
-            out.append({
-                "kind": kind,
-                "text": item.get("text") or item.get("name") or "",
-                "selector": item.get("selector", ""),
-                "href": item.get("href") or "",
-            })
-
-        def matches(text: str, selector: str) -> bool:
-            if not ql:
-                return False
-            tl = _canon(text)
-            sl = _canon(selector)
-            if ql in tl or ql in sl:
-                return True
-            return _overlap(ql, tl) > 0
-
-        for b in page.get("buttons", []) or []:
-            if matches(b.get("text", ""), b.get("selector", "")):
-                add("button", b)
-        for a in page.get("links", []) or []:
-            if matches(a.get("text", ""), a.get("selector", "")):
-                add("link", a)
-        for i in page.get("inputs", []) or []:
-            hay = " ".join([i.get("name", ""), i.get("placeholder", ""), i.get("selector", "")]).lower()
-            if ql and ql in hay:
-                add("input", i)
-
-        def score(item: Dict[str, Any]):
-            ov = _overlap(ql, item.get("text", ""))
-            return (ov, -len(item.get("selector", "") or ""))
-
-        out.sort(key=score, reverse=True)
-        return out
+        if not ql:
+            return [], 0
+        q_tokens = set(ql.split())
+        c = _columns()
+        scored: List[tuple] = []
+
+        for i, (kind, hay, tt) in enumerate(zip(c["kind"], c["canon"], c["tokens"])):
+            if tt is None:
+                # input: substring match on name/placeholder/selector
+                if ql not in hay:
+                    continue
+            elif not (q_tokens & tt) and ql not in hay and ql not in c["sel"][i]:
+                continue
+            ov = len(q_tokens & c["shown_tokens"][i])
+            scored.append(((ov, c["sel_len"][i]), kind, c["text"][i], c["item"][i]))
+
+        # nlargest is stable like sorted(), so snapshot order holds among equal scores
+        top = heapq.nlargest(limit, scored, key=itemgetter(0))
+        return [
+            {"kind": kind, "text": text, "selector": item.get("selector", ""), "href": item.get("href") or ""}
+            for _, kind, text, item in top
+        ], len(scored)
 
     # ── Tool impls (return JSON strings; graphs parse ToolMessage.content) ───
+    # find() over this fixed page is pure in `query`; cached apps reuse the
+    # toolset across requests, so repeat queries return the encoded result.
+    _find_results: Dict[str, str] = {}
+
     def find_func(query: str) -> str:
-        matches = _search(query)
-        return json.dumps({"matches": matches[:6], "total": len(matches)})
+        out = _find_results.get(query)
+        if out is None:
+            matches, total = _search(query, 6)
+            out = _dumps({"matches": matches, "total": total})
+            if len(_find_results) < 64:  # planner queries are a handful of fixed strings
+                _find_results[query] = out
+        return out
 
     def click_func(selector: str) -> str:
         links = page.get("links", []) or []
@@ -178,7 +227,7 @@ def build_tools(page: Dict[str, Any]) -> List[StructuredTool]:
             if a.get("selector", "") == selector and a.get("href"):
                 nav = a.get("href")
                 break
-        return json.dumps({
+        return _dumps({
             "ok": True,
             "selector": selector,
             "navigate_to": nav,  # client can decide to navigate
@@ -187,45 +236,82 @@ def build_tools(page: Dict[str, Any]) -> List[StructuredTool]:
 
     def type_func(selector: str, text: str) -> str:
         all_sel = {x.get("selector", "") for x in (page.get("inputs", []) or [])}
-        return json.dumps({
+        return _dumps({
             "ok": (selector in all_sel) or not all_sel,
             "selector": selector,
             "typed": text,
             "note": "proxy-type"
         })
 
-    def wait_func(seconds: Optional[int] = None, ms: Optional[int] = None) -> str:
+    def _wait_ms(seconds: Optional[int], ms: Optional[int]) -> int:
         wait_ms = 0
         if isinstance(seconds, int):
             wait_ms = max(wait_ms, min(seconds, 60) * 1000)
         if isinstance(ms, int):
             wait_ms = max(wait_ms, min(ms, 60_000))
+        return wait_ms
+
+    def _idle_ms(quietMs: Optional[int], timeout: Optional[int]) -> int:
+        # Server cannot detect real browser idleness; we simulate a small pause.
+        return max(0, min(int(quietMs or 0), int(timeout or 0), 60_000))
+
+    def wait_func(seconds: Optional[int] = None, ms: Optional[int] = None) -> str:
+        wait_ms = _wait_ms(seconds, ms)
         if wait_ms > 0:
             time.sleep(wait_ms / 1000.0)
-        return json.dumps({"ok": True, "waited": wait_ms})
+        return _dumps({"ok": True, "waited": wait_ms})
+
+    async def await_func(seconds: Optional[int] = None, ms: Optional[int] = None) -> str:
+        wait_ms = _wait_ms(seconds, ms)
+        if wait_ms > 0:
+            await asyncio.sleep(wait_ms / 1000.0)
+        return _dumps({"ok": True, "waited": wait_ms})
 
     def wait_for_idle_func(quietMs: Optional[int] = 600, timeout: Optional[int] = 3000) -> str:
-        # Server cannot detect real browser idleness; we simulate a small pause.
-        slept = max(0, min(int(quietMs or 0), int(timeout or 0), 60_000))
+        slept = _idle_ms(quietMs, timeout)
         if slept:
             time.sleep(slept / 1000.0)
-        return json.dumps({"idle": True, "slept_ms": slept})
+        return _dumps({"idle": True, "slept_ms": slept})
 
-    def get_page_state_func() -> str:
+    async def await_for_idle_func(quietMs: Optional[int] = 600, timeout: Optional[int] = 3000) -> str:
+        slept = _idle_ms(quietMs, timeout)
+        if slept:
+            await asyncio.sleep(slept / 1000.0)
+        return _dumps({"idle": True, "slept_ms": slept})
+
+    page_json: Optional[str] = None  # fallback snapshot, encoded on first use
+
+    def _read_page_state() -> str:
         """
         Return the latest extension-provided snapshot if available; otherwise
         fallback to the initial `page` this toolset was built with.
         """
-        snap = get_latest_snapshot() or page or {}
+        nonlocal page_json
+        latest = get_latest_snapshot_json()
+        if latest is not None:
+            src, (out, url) = "bridge", latest
+        else:
+            if page_json is None:
+                page_json = _dumps(page or {})
+            src, out, url = "fallback", page_json, (page or {}).get("url")
         try:
-            src = "bridge" if get_latest_snapshot() else "fallback"
-            print(f"[get_page_state] {src} {snap.get('url')}")
+            print(f"[get_page_state] {src} {url}")
         except Exception:
             pass
-        return json.dumps(snap)
+        return out
+
+    def get_page_state_func(settle_ms: Optional[int] = 0) -> str:
+        if settle_ms:
+            time.sleep(min(settle_ms, 60_000) / 1000.0)
+        return _read_page_state()
+
+    async def aget_page_state_func(settle_ms: Optional[int] = 0) -> str:
+        if settle_ms:
+            await asyncio.sleep(min(settle_ms, 60_000) / 1000.0)
+        return _read_page_state()
 
     def done_func(reason: str) -> str:
-        return json.dumps({"done": True, "reason": reason})
+        return _dumps({"done": True, "reason": reason})
 
     # ── Export tools ─────────────────────────────────────────────────────────
     return [
@@ -250,12 +336,14 @@ def build_tools(page: Dict[str, Any]) -> List[StructuredTool]:
         ),
         StructuredTool.from_function(
             wait_func,
+            coroutine=await_func,
             name="wait",
             description="Pause execution; accepts either {seconds} or {ms}",
             args_schema=WaitInput,
         ),
         StructuredTool.from_function(
             wait_for_idle_func,
+            coroutine=await_for_idle_func,
             name="wait_for_idle",
             description="Server-side idle simulation; sleeps briefly to let SPA settle",
             args_schema=WaitIdleInput,
@@ -264,9 +352,10 @@ def build_tools(page: Dict[str, Any]) -> List[StructuredTool]:
         # Subgraph-required tools
         StructuredTool.from_function(
             get_page_state_func,
+            coroutine=aget_page_state_func,
             name="get_page_state",
-            description="Return the freshest DOM snapshot pushed by the extension; fallback to initial page",
-            args_schema=EmptyInput,
+            description="Return the freshest DOM snapshot pushed by the extension (after an optional settle_ms pause); fallback to initial page",
+            args_schema=PageStateInput,
         ),
         StructuredTool.from_function(
             done_func,
@@ -108,8 +108,14 @@ def embed_texts(texts: List[str]) -> List[List[float]]:
 
     return vecs
 
-def doc_hash(url: str, title: str, content: str) -> str:
-    return sha256(f"{url}|{title}|{content}".encode("utf-8")).hexdigest()
+def doc_hash_prefix(url: str, title: str):
+    """sha256 state over the shared `url|title|` prefix; copy() it per chunk."""
+    return sha256(f"{url}|{title}|".encode("utf-8"))
+
+def doc_hash(url: str, title: str, content: str, prefix=None) -> str:
+    h = (prefix or doc_hash_prefix(url, title)).copy()
+    h.update(content.encode("utf-8"))
+    return h.hexdigest()
 
 # Routes
 @app.get("/health")
@@ -132,9 +138,15 @@ def scrape(page: PageData, x_api_key: Optional[str] = Header(default=None)):
     domain = urlparse(page.url).netloc
     now = datetime.now(timezone.utc).isoformat()
 
+    # Page-level fields are the same for every chunk: build them once, and
+    # hash the shared url|title prefix once.
+    links = [l.model_dump() for l in page.links[:200]]
+    images = page.images[:200]
+    prefix = doc_hash_prefix(page.url, page.title)
+
     docs = []
     for i, (content, vec) in enumerate(zip(chunks, vectors)):
-        ch = doc_hash(page.url, page.title, content)
+        ch = doc_hash(page.url, page.title, content, prefix)
         docs.append({
             "url": page.url,
             "domain": domain,
@@ -142,8 +154,8 @@ def scrape(page: PageData, x_api_key: Optional[str] = Header(default=None)):
             "chunk_index": i,
             "chunk_hash": ch,
             "content": content,
-            "links": [l.model_dump() for l in page.links][:200],
-            "images": page.images[:200],
+            "links": links,
+            "images": images,
             "embedding": vec,  # vector field used by Atlas Vector Search
             "meta": {"source": SOURCE_TAG},
             "created_at": now,
@@ -15,7 +15,9 @@ def add(session_id: str, role: str, content: str):
     })
 
 def recent(session_id: str, last_n: int):
-    docs = list(_msgs.find({"sessionId": ObjectId(session_id)})
+    # Projected server-side, so the docs already are the {role, content} turns
+    docs = list(_msgs.find({"sessionId": ObjectId(session_id)},
+                           {"_id": 0, "role": 1, "content": 1})
                 .sort("createdAt", DESCENDING).limit(last_n))
     docs.reverse()
-    return [{"role": d["role"], "content": d["content"]} for d in docs]
+    return docs
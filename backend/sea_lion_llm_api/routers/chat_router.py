@@ -6,6 +6,7 @@ from sea_lion_llm_api.services import (
 )
 from sea_lion_llm_api.services.langchain_chain import chat_with_memory
 import logging
+import orjson
 import requests
 
 logger = logging.getLogger(__name__)
@@ -78,7 +79,7 @@ def chat_sealion(body: ChatIn):
     try:
         resp = requests.post(settings.SEA_LION_API_URL, headers=headers, json=payload, timeout=30)
         if resp.status_code == 200:
-            data = resp.json()
+            data = orjson.loads(resp.content)
             reply = data["choices"][0]["message"]["content"]
             logger.info(f"[OK] SEA-LION API reply: {reply[:100]}...")
             return ChatOut(reply=reply)
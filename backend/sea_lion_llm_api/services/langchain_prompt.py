@@ -1,4 +1,5 @@
 import json
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from sea_lion_llm_api.data.repositories import memory_repo
 import logging
@@ -12,6 +13,9 @@ DEFAULT_SYSTEM_PROMPT = (
     "instructions, and the user's preferred dialect when possible. "
     "If information is missing, ask one concise question."
 )
+# Built once per process; message objects in a template are passed through
+# verbatim, so only the "{input}" turn is parsed as a template.
+_SYSTEM_MSG = SystemMessage(content=DEFAULT_SYSTEM_PROMPT)
 
 def build_prompt(session_id: str) -> ChatPromptTemplate:
     logger.info(f"=== BUILDING PROMPT ===")
@@ -29,22 +33,21 @@ def build_prompt(session_id: str) -> ChatPromptTemplate:
         
         logger.info("STEP 3: Processing facts JSON")
         facts_json = json.dumps(facts, ensure_ascii=False)
-        # Escape curly braces so they are treated as literals by the template engine
-        facts_json_escaped = facts_json.replace("{", "{{").replace("}", "}}")
-        logger.info(f"[OK] Facts JSON processed and escaped")
+        logger.info(f"[OK] Facts JSON processed")
         
         logger.info("STEP 4: Building context block")
         context_block = (
             f"Context summary:\n{summary}\n\n"
-            f"Known facts (JSON): {facts_json_escaped}\n"
+            f"Known facts (JSON): {facts_json}\n"
             "If facts conflict with the user, politely ask to confirm."
         )
         logger.info(f"[OK] Context block created: {context_block[:200]}...")
         
         logger.info("STEP 5: Creating ChatPromptTemplate")
         prompt_template = ChatPromptTemplate.from_messages([
-            ("system", sys),
-            ("system", context_block),
+            _SYSTEM_MSG,
+            # a literal message, so braces in the facts JSON need no escaping
+            SystemMessage(content=context_block),
             MessagesPlaceholder("chat_history"),
             ("human", "{input}")
         ])
@@ -4,6 +4,8 @@ from sea_lion_llm_api.data.repositories import memory_repo, message_repo
 from typing import List, Dict
 import re
 
+_WS_RE = re.compile(r"\s+")
+
 def build_context_block(session_id: str) -> str:
     summary, facts = memory_repo.get_for_session(session_id)
     return (
@@ -14,11 +16,21 @@ def build_context_block(session_id: str) -> str:
 
 def _simple_summarize(messages: List[Dict[str, str]]) -> str:
     """Very lightweight summarizer: keeps last user intent and assistant action."""
-    last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
-    last_assistant = next((m["content"] for m in reversed(messages) if m["role"] == "assistant"), "")
+    # One index walk from the tail, stopping once both roles are found
+    last_user = last_assistant = None
+    for i in range(len(messages) - 1, -1, -1):
+        role = messages[i]["role"]
+        if role == "user" and last_user is None:
+            last_user = messages[i]["content"]
+        elif role == "assistant" and last_assistant is None:
+            last_assistant = messages[i]["content"]
+        if last_user is not None and last_assistant is not None:
+            break
+    last_user = last_user or ""
+    last_assistant = last_assistant or ""
     # Trim to avoid excessive growth
-    last_user = re.sub(r"\s+", " ", last_user).strip()[:300]
-    last_assistant = re.sub(r"\s+", " ", last_assistant).strip()[:300]
+    last_user = _WS_RE.sub(" ", last_user).strip()[:300]
+    last_assistant = _WS_RE.sub(" ", last_assistant).strip()[:300]
     return f"Last user intent: {last_user}\nAssistant reply: {last_assistant}"
 
 def on_new_turn(session_id: str):
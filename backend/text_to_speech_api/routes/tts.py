@@ -1,15 +1,14 @@
 # routes/tts.py
-from fastapi import APIRouter, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from services.tts_service import generate_tts_mp3
+from services.tts_service import generate_tts_chunks
 from services.translate_service import (
     translate_with_sealion,
     detect_language_with_sealion,
     normalize_lang_for_tts,
 )
-import uuid
-import os
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,20 +26,18 @@ class SpeakRequest(BaseModel):
     source_lang: str | None = Field(None, description="Optional hint for source language")
 
 @router.post("/speak")
-def speak(
-    request: SpeakRequest,
-    background_tasks: BackgroundTasks
-):
+async def speak(request: SpeakRequest):
     """
     Flow:
       - If translate_to/lang are 'auto' (or missing), detect the language with Sea Lion
       - Translate text into that language (no-op if same language)
-      - TTS using the mapped voice code
+      - TTS using the mapped voice code, streamed back as MP3 chunks
+    Blocking Sea Lion / gTTS calls run in worker threads to keep the loop free.
     """
     try:
         text = request.text or ""
         if not text.strip():
-            return JSONResponse(status_code=400, content={"error": "Empty text"})
+            return ORJSONResponse(status_code=400, content={"error": "Empty text"})
 
         # 1) Detect language if needed
         target_name = None
@@ -49,7 +46,7 @@ def speak(
         if (request.translate_to is None) or (str(request.translate_to).lower() == "auto") \
            or (request.lang is None) or (str(request.lang).lower() == "auto"):
             try:
-                detected_label = detect_language_with_sealion(text)
+                detected_label = await asyncio.to_thread(detect_language_with_sealion, text)
                 target_name, tts_code = normalize_lang_for_tts(detected_label)
                 logger.info("Detected language '%s' → target=%s, tts=%s",
                             detected_label, target_name, tts_code)
@@ -68,7 +65,8 @@ def speak(
         # 2) Translate (idempotent if same language)
         final_text = text
         try:
-            final_text = translate_with_sealion(
+            final_text = await asyncio.to_thread(
+                translate_with_sealion,
                 text=text,
                 target_lang=target_name or "English",
                 source_lang=request.source_lang
@@ -77,15 +75,18 @@ def speak(
             logger.exception("Sea Lion translation failed; falling back to original text")
             final_text = text
 
-        # 3) Synthesize
-        filename = f"tts_{uuid.uuid4().hex}.mp3"
-        generate_tts_mp3(final_text, tts_code or "en", filename)
-        background_tasks.add_task(os.remove, filename)
+        # 3) Synthesize: the first chunk is fetched in the worker thread, so gTTS
+        #    errors still map to an error response; the rest streams from a threadpool
+        chunks = await asyncio.to_thread(generate_tts_chunks, final_text, tts_code or "en")
 
-        return FileResponse(filename, media_type="audio/mpeg", filename=filename)
+        return StreamingResponse(
+            chunks,
+            media_type="audio/mpeg",
+            headers={"Content-Disposition": 'attachment; filename="tts.mp3"'},
+        )
 
     except ValueError as e:
-        return JSONResponse(status_code=400, content={"error": str(e)})
+        return ORJSONResponse(status_code=400, content={"error": str(e)})
     except Exception:
         logger.exception("Unexpected error in /speak")
-        return JSONResponse(status_code=500, content={"error": "Internal server error"})
+        return ORJSONResponse(status_code=500, content={"error": "Internal server error"})
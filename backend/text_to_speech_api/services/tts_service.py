@@ -1,5 +1,77 @@
+import hashlib
+import itertools
+import logging
+import os
+from typing import Iterator, List, Optional
+
 from gtts import gTTS
 
-def generate_tts_mp3(text: str, lang: str, filename: str):
-    tts = gTTS(text=text, lang=lang)
-    tts.save(filename)
+logger = logging.getLogger(__name__)
+
+# Optional Redis cache for synthesized audio: short prompts (menu labels,
+# confirmations) repeat often, so identical text+lang is served from cache.
+REDIS_URL = os.getenv("REDIS_URL", "").strip()
+TTS_CACHE_TTL_S = int(os.getenv("TTS_CACHE_TTL_S", str(7 * 24 * 3600)))
+# Long texts make big, rarely repeated MP3s: stream those without caching
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024)))
+# Short socket timeouts so a Redis outage falls back to synthesis quickly
+REDIS_TIMEOUT_S = float(os.getenv("REDIS_TIMEOUT_S", "0.5"))
+
+_redis = None
+if REDIS_URL:
+    import redis
+
+    _redis = redis.Redis.from_url(
+        REDIS_URL, socket_connect_timeout=REDIS_TIMEOUT_S, socket_timeout=REDIS_TIMEOUT_S
+    )
+
+
+def _cache_key(text: str, lang: str) -> str:
+    return "tts:" + hashlib.sha256(f"{lang}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str) -> Optional[bytes]:
+    if _redis is None:
+        return None
+    try:
+        return _redis.get(key)
+    except Exception:
+        logger.warning("TTS cache read failed", exc_info=True)
+        return None
+
+
+def _stream_and_cache(tts: gTTS, key: str) -> Iterator[bytes]:
+    parts: Optional[List[bytes]] = [] if _redis is not None else None
+    size = 0
+    for chunk in tts.stream():
+        if parts is not None:
+            size += len(chunk)
+            # over the cap: stop buffering, this one won't be cached
+            if size > TTS_CACHE_MAX_BYTES:
+                parts = None
+            else:
+                parts.append(chunk)
+        yield chunk
+    if parts is not None:
+        try:
+            _redis.set(key, b"".join(parts), ex=TTS_CACHE_TTL_S)
+        except Exception:
+            logger.warning("TTS cache write failed", exc_info=True)
+
+
+def generate_tts_chunks(text: str, lang: str) -> Iterator[bytes]:
+    """Return an iterator of MP3 bytes for `text`, streamed as gTTS synthesizes.
+
+    gTTS is constructed and the first chunk fetched eagerly, so an unsupported
+    `lang` (ValueError) or an upstream/network failure raises here, before any
+    response bytes are sent.
+    """
+    key = _cache_key(text, lang)
+    cached = _cache_get(key)
+    if cached:
+        return iter((cached,))
+    stream = _stream_and_cache(gTTS(text=text, lang=lang), key)
+    first = next(stream, None)
+    if first is None:
+        return iter(())
+    return itertools.chain((first,), stream)